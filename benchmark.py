@@ -0,0 +1,219 @@
+"""Reproducible benchmarks for the prediction, simulation and encoding hot paths
+
+Runs fully offline by default: the scenario model uses the tiny hashing encoder
+and artifacts go to a temporary directory. Results are written as JSON so runs
+can be compared across commits:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --encoder bert --years 10 50 100 --clients 8
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCENARIOS = [
+    "Rapid urban sprawl and deforestation with failing drainage systems.",
+    "Forest restoration and dam reinforcement in a temperate climate.",
+    "Torrential rain due to warming oceans and blocked city drainage.",
+    "Smart city development with rainfall capture and storage systems."
+]
+
+INPUTS = {"rainfall": 120, "waterLevel": 3.5, "humidity": 80, "temperature": 22}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "n": int(len(latencies)),
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+    }
+
+
+def time_calls(fn, repeats, warmup=2):
+    """Latency summary of calling ``fn`` sequentially"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def time_concurrent(fn, clients, requests_per_client):
+    """Throughput and latency with ``clients`` threads calling ``fn`` at once"""
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients + 1)
+
+    def client():
+        own = []
+        barrier.wait()
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            fn()
+            own.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    result = summarize(latencies)
+    result["clients"] = clients
+    result["throughput_rps"] = round(len(latencies) / elapsed, 1)
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    # The server resolves its dataset and artifacts relative to the repository
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    # Configure the server before importing it
+    os.environ["FLOODSENSE_ENCODER"] = args.encoder
+    os.environ.setdefault("FLOODSENSE_ARTIFACT_DIR", tempfile.mkdtemp(prefix="floodsense-bench-"))
+    # Measure the computation itself rather than response cache hits
+    os.environ.setdefault("FLOODSENSE_RESPONSE_CACHE_SIZE", "0")
+
+    results = {}
+
+    start = time.perf_counter()
+    import server
+    results["server_import_s"] = round(time.perf_counter() - start, 3)
+
+    client = server.app.test_client()
+
+    def post(path, body):
+        response = client.post(path, json=body)
+        assert response.status_code == 200, response.status_code
+        return response
+
+    # Model loading and training, timed from a cold start
+    for lazy_model in (server.risk_artifacts, server.scenario_model):
+        lazy_model.get()
+        results[f"load_{lazy_model.name}_s"] = round(lazy_model.load_seconds, 3)
+
+    results["train_risk_model"] = time_calls(server.train_risk_artifacts, repeats=args.train_repeats, warmup=0)
+    model = server.scenario_model.get()
+    results["train_scenario_model"] = time_calls(model._train_model, repeats=args.train_repeats, warmup=0)
+
+    # Risk model inference, sklearn against the compiled tree arrays
+    import tree_inference
+    risk_model = server.risk_artifacts.get()["flood_risk_model"]
+    compiled = server.flood_risk_model.get()
+    if isinstance(compiled, tree_inference.CompiledTreeEnsemble):
+        timings = tree_inference.benchmark_predict(risk_model, compiled, args.predict_batch_sizes, args.repeats)
+        for n, timing in timings.items():
+            results[f"risk_model_predict_{n}"] = {
+                "sklearn_ms": round(timing["sklearn"] * 1000, 4),
+                "compiled_ms": round(timing["compiled"] * 1000, 4),
+                "speedup": round(timing["speedup"], 2)
+            }
+
+    # Encoder and scenario model, bypassing the embedding cache
+    scenario_iter = iter(range(10 ** 9))
+
+    def uncached_encode():
+        model.embedding_cache.clear()
+        model._encode(SCENARIOS[next(scenario_iter) % len(SCENARIOS)])
+
+    results["encode"] = time_calls(uncached_encode, args.repeats)
+    results["encode_cached"] = time_calls(lambda: model._encode(SCENARIOS[0]), args.repeats)
+    results["scenario_predict"] = time_calls(lambda: model.predict(SCENARIOS[1]), args.repeats)
+    results["scenario_predict_batch"] = time_calls(lambda: model.predict_batch(SCENARIOS * 4), args.repeats)
+
+    # Simulation engine directly and through the API
+    features = {f: 6.0 for f in server.FACTOR_NAMES}
+    features.update(Rainfall=120, WaterLevel=3.5, Humidity=80, Temperature=22)
+    results["api_predict"] = time_calls(lambda: post('/api/predict', INPUTS), args.repeats)
+    for years in args.years:
+        results[f"simulate_and_narrate_{years}y"] = time_calls(
+            lambda: server.simulate_and_narrate(features, years), args.repeats)
+        results[f"api_simulate_{years}y"] = time_calls(
+            lambda: post('/api/simulate', dict(INPUTS, scenario=SCENARIOS[2], years=years)), args.repeats)
+
+    # Throughput under concurrent clients
+    results["api_predict_concurrent"] = time_concurrent(
+        lambda: post('/api/predict', INPUTS), args.clients, args.requests_per_client)
+    results["api_simulate_concurrent"] = time_concurrent(
+        lambda: post('/api/simulate', dict(INPUTS, scenario=SCENARIOS[3], years=args.years[0])),
+        args.clients, args.requests_per_client)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the FloodSense hot paths")
+    parser.add_argument("--encoder", default="hashing",
+                        help="Scenario encoder backend (default: offline hashing stub)")
+    parser.add_argument("--years", type=int, nargs="+", default=[10, 20, 50])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--predict-batch-sizes", type=int, nargs="+", default=[1, 1000, 1000000],
+                        help="Batch sizes for the sklearn vs compiled risk model comparison")
+    parser.add_argument("--train-repeats", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests-per-client", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    args.output = os.path.abspath(args.output)
+
+    np.random.seed(args.seed)
+    results = run(args)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Benchmark results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
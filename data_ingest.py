@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+
+# Columns of the risk model training data; the free-text column is never loaded
+FEATURE_COLUMNS = ['Rainfall (mm)', 'Water Level (m)', 'Humidity (%)', 'Temperature (°C)']
+LABEL_COLUMN = 'labels'
+TARGET_COLUMN = 'label_mean'
+
+DEFAULT_CHUNK_ROWS = 100000
+
+
+def parse_label_means(labels):
+    """Mean of each label list string such as "[1, 2, 3, 4, 5]", without eval
+
+    Lists may have different lengths. A row with any entry that is not a
+    number, or with no entries at all, gets a NaN mean.
+    """
+    import pandas as pd
+    labels = pd.Series(labels, dtype="object").astype(str)
+    parts = labels.str.replace(r"[\[\]\s]", "", regex=True).str.split(",", expand=True)
+    values = parts.apply(pd.to_numeric, errors="coerce")
+    # Shorter lists are padded with None; any other NaN is an entry that failed to parse
+    malformed = (values.isna() & parts.notna()).any(axis=1)
+    return values.mean(axis=1).mask(malformed).to_numpy(dtype=float)
+
+
+def iter_frames(path, columns, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield DataFrames of ``columns`` from a CSV or Parquet file, ``chunk_rows`` rows at a time"""
+    import pandas as pd
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet training data requires pyarrow (pip install pyarrow)")
+        # Parquet is columnar, so only the requested columns are read from disk
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows)
+
+
+def iter_training_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield ``(X, y)`` arrays per chunk, dropping rows with missing features or unparseable labels"""
+    for frame in iter_frames(path, FEATURE_COLUMNS + [LABEL_COLUMN], chunk_rows):
+        X = frame[FEATURE_COLUMNS].to_numpy(dtype=float)
+        y = parse_label_means(frame[LABEL_COLUMN])
+        valid = np.isfinite(X).all(axis=1) & np.isfinite(y)
+        if not valid.all():
+            print(f"Skipping {int((~valid).sum())} training rows with missing values or bad labels")
+        yield X[valid], y[valid]
+
+
+def load_training_frame(path, chunk_rows=DEFAULT_CHUNK_ROWS, max_rows=None, seed=0):
+    """Features plus the parsed label mean of every row, or of a uniform sample of ``max_rows``
+
+    Chunks are read one at a time. With ``max_rows`` only the rows with the
+    smallest random keys are kept, so memory stays bounded by ``max_rows``
+    plus one chunk however large the file is.
+    """
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    kept = []
+    rows = 0
+    for X, y in iter_training_chunks(path, chunk_rows):
+        frame = pd.DataFrame(X, columns=FEATURE_COLUMNS)
+        frame[TARGET_COLUMN] = y
+        if max_rows is not None:
+            frame["_row"] = rows + np.arange(len(frame))
+            frame["_key"] = rng.random(len(frame))
+            kept = [pd.concat(kept + [frame], ignore_index=True).nsmallest(max_rows, "_key")]
+        else:
+            kept.append(frame)
+        rows += len(frame)
+
+    if not kept:
+        return pd.DataFrame(columns=FEATURE_COLUMNS + [TARGET_COLUMN])
+    frame = pd.concat(kept, ignore_index=True)
+    if max_rows is not None:
+        # Restore file order so the sample trains the same way however it was chunked
+        frame = frame.sort_values("_row").drop(columns=["_row", "_key"]).reset_index(drop=True)
+        print(f"Sampled {len(frame)} of {rows} training rows")
+    return frame
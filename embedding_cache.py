@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: the disk tier works but is not safe to share between processes
+    fcntl = None
+
+
+def normalize_text(text):
+    """Normalize scenario text so trivially different submissions share a cache entry"""
+    return " ".join(str(text).lower().split())
+
+
+def text_key(text, namespace=""):
+    """Stable hash of the normalized text, scoped to an encoder namespace"""
+    return hashlib.sha1(f"{namespace}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def store_dir(root, namespace, dim):
+    """Disk tier directory for one encoder and embedding dimension"""
+    name = re.sub(r"[^\w.-]+", "_", namespace) or "default"
+    return os.path.join(root, f"{name}-{dim}d")
+
+
+class DiskEmbeddingStore:
+    """Append-only float32 memory-mapped embedding store with a text index
+
+    Rows live in ``embeddings.f32`` and ``index.tsv`` maps keys to rows. Writers
+    take an exclusive file lock so several worker processes can share a directory.
+    """
+
+    def __init__(self, path, dim, capacity=100000):
+        self.path = path
+        self.dim = dim
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, "embeddings.f32")
+        self.index_path = os.path.join(path, "index.tsv")
+        self.lock_path = os.path.join(path, "lock")
+
+        self.index = {}
+        self._index_offset = 0
+        self._index_lock = threading.Lock()
+
+        # Creating the files happens under the writer lock so two processes
+        # starting together cannot truncate each other's store
+        with self._file_lock():
+            meta_path = os.path.join(path, "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                if meta["dim"] != dim:
+                    raise ValueError(f"Embedding store at {path} has dim {meta['dim']}, expected {dim}")
+                self.capacity = meta["capacity"]
+            else:
+                self.capacity = capacity
+                with open(meta_path, "w") as f:
+                    json.dump({"dim": dim, "capacity": capacity}, f)
+
+            mode = "r+" if os.path.exists(self.data_path) else "w+"
+            self.data = np.memmap(self.data_path, dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+        self._refresh_index()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _refresh_index(self):
+        # Pick up rows appended by other processes since the last read
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == self._index_offset:
+            return
+        with self._index_lock, open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written line, read it next time
+                key, row = line.decode("utf-8").split("\t")
+                self.index[key] = int(row)
+                self._index_offset += len(line)
+
+    def get(self, key):
+        row = self.index.get(key)
+        if row is None:
+            self._refresh_index()
+            row = self.index.get(key)
+        if row is None:
+            return None
+        return np.array(self.data[row])
+
+    def put(self, key, embedding):
+        """Store an embedding, returning False when the store is full"""
+        with self._file_lock():
+            self._refresh_index()
+            if key in self.index:
+                return True
+            row = len(self.index)
+            if row >= self.capacity:
+                return False
+            self.data[row] = embedding
+            self.data.flush()
+            with open(self.index_path, "a") as f:
+                f.write(f"{key}\t{row}\n")
+            self._refresh_index()
+            return True
+
+    def __len__(self):
+        self._refresh_index()
+        return len(self.index)
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of text embeddings bounded by memory size
+
+    Misses fall through to an optional ``DiskEmbeddingStore`` before the caller
+    has to run the encoder.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, disk_path=None, disk_capacity=100000, namespace="", dim=None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_capacity = disk_capacity
+        self.namespace = namespace
+        self.dim = dim
+        self.disk = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Reopen an existing store so entries survive restarts. Each encoder and
+        # dimension has its own directory, so switching encoders never mixes rows.
+        if disk_path and dim and os.path.exists(os.path.join(store_dir(disk_path, namespace, dim), "meta.json")):
+            self.disk = self._open_disk(dim)
+
+    def _open_disk(self, dim):
+        path = store_dir(self.disk_path, self.namespace, dim)
+        try:
+            return DiskEmbeddingStore(path, dim, self.disk_capacity)
+        except ValueError as e:
+            print(f"Embedding disk cache disabled: {e}")
+            self.disk_path = None
+            return None
+
+    def _fits(self, emb):
+        # An embedding of another size is a miss rather than an input the model cannot use
+        return emb is not None and (self.dim is None or emb.shape[-1] == self.dim)
+
+    def key(self, text):
+        return text_key(text, self.namespace)
+
+    def get(self, text):
+        key = self.key(text)
+        with self._lock:
+            emb = self._entries.get(key)
+            if self._fits(emb):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return emb
+
+        if self.disk is not None:
+            emb = self.disk.get(key)
+            if self._fits(emb):
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, emb)
+                return emb
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        embedding.flags.writeable = False
+        if not self._fits(embedding):
+            return
+        key = self.key(text)
+        self._put_memory(key, embedding)
+
+        if self.disk_path is not None:
+            with self._lock:
+                if self.disk is None and self.disk_path is not None:
+                    # The store is created lazily because the dimension may only be known now
+                    self.dim = embedding.shape[-1]
+                    self.disk = self._open_disk(self.dim)
+            if self.disk is not None:
+                self.disk.put(key, embedding)
+
+    def _put_memory(self, key, embedding):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = embedding
+            self._bytes += embedding.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "disk_entries": len(self.disk) if self.disk is not None else 0
+            }
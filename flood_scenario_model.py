@@ -1,112 +1,291 @@
-import torch
+import time
 import numpy as np
-from transformers import BertTokenizer, BertModel
 from sklearn.multioutput import MultiOutputRegressor
 from sklearn.ensemble import GradientBoostingRegressor
 from sklearn.preprocessing import MinMaxScaler
-from sklearn.model_selection import cross_val_score, KFold
-import joblib
+from sklearn.model_selection import KFold
+from sklearn.base import clone
+from joblib import Parallel, delayed
 import os
+import sklearn
+from embedding_cache import EmbeddingCache
+from metrics import stage
+from model_store import ArtifactStore, fingerprint
+from scenario_encoders import ENCODER_BACKENDS, create_encoder
+
+# Expanded training data with more diverse scenarios
+SCENARIO_TRAINING_DATA = [
+    {"text": "Rapid urban sprawl and deforestation with failing drainage systems.", "labels": [9, 8, 6, 2, 4]},
+    {"text": "Rising sea levels and torrential rain from climate change.", "labels": [4, 3, 9, 3, 3]},
+    {"text": "Forest restoration and dam reinforcement in a temperate climate.", "labels": [2, 2, 4, 7, 9]},
+    {"text": "Extreme heat and drying wetlands with urban expansion and poor dams.", "labels": [7, 7, 9, 4, 2]},
+    {"text": "Excellent drainage and strong dam systems in low urban density areas.", "labels": [3, 3, 4, 9, 9]},
+    {"text": "Massive deforestation and heatwaves with weak infrastructure.", "labels": [6, 9, 8, 2, 3]},
+    {"text": "Reforestation efforts and green policies reduce climate impact.", "labels": [3, 2, 3, 8, 8]},
+    {"text": "Torrential rain due to warming oceans and blocked city drainage.", "labels": [6, 4, 9, 1, 4]},
+    # Additional scenarios to improve model robustness
+    {"text": "Urban development in floodplains with increased impervious surfaces.", "labels": [9, 5, 6, 3, 5]},
+    {"text": "Restoration of wetlands and natural water retention areas.", "labels": [4, 2, 5, 8, 7]},
+    {"text": "Aging dams and levees with deferred maintenance in areas with heavy rainfall.", "labels": [5, 4, 7, 5, 2]},
+    {"text": "Green infrastructure implementation with permeable surfaces in urban areas.", "labels": [6, 3, 5, 8, 6]},
+    {"text": "Coastal erosion with sea level rise and storm surges.", "labels": [5, 6, 9, 4, 3]},
+    {"text": "Mountain deforestation leading to increased runoff and soil erosion.", "labels": [6, 9, 7, 3, 4]},
+    {"text": "River basin management with integrated flood control measures.", "labels": [5, 4, 5, 8, 8]},
+    {"text": "Agricultural expansion with soil compaction and drainage modifications.", "labels": [7, 8, 6, 3, 4]},
+    {"text": "Dense urban centers with outdated stormwater systems.", "labels": [9, 4, 6, 2, 5]},
+    {"text": "Smart city development with rainfall capture and storage systems.", "labels": [8, 3, 5, 9, 7]},
+    {"text": "Severe drought followed by intense rainfall on dry soil.", "labels": [5, 6, 8, 4, 5]},
+    {"text": "Polar ice melting rapidly with stronger hurricanes.", "labels": [4, 5, 10, 3, 5]},
+    {"text": "Complete ecosystem restoration and nature-based solutions for flood management.", "labels": [2, 1, 3, 9, 8]},
+    {"text": "Catastrophic dam failure in area with extreme precipitation events.", "labels": [5, 6, 8, 5, 1]},
+    {"text": "Improved urban planning with flood-resilient building codes and zoning.", "labels": [6, 4, 5, 7, 7]}
+]
+
+# Hyperparameters of the per-dimension regressor; part of the artifact fingerprint
+SCENARIO_MODEL_PARAMS = dict(
+    n_estimators=100,
+    learning_rate=0.05,
+    max_depth=3,
+    min_samples_split=3,
+    loss='squared_error',
+    random_state=42
+)
+
+# Histogram-based head for larger corpora: it bins the embedding features once,
+# so training time grows far more slowly with the number of scenarios
+SCENARIO_HIST_PARAMS = dict(
+    max_iter=100,
+    learning_rate=0.05,
+    max_depth=3,
+    min_samples_leaf=2,
+    loss='squared_error',
+    random_state=42
+)
+
+
+def hist_regressor():
+    """Histogram-based head, imported only when selected since it is experimental before scikit-learn 1.0"""
+    try:
+        from sklearn.ensemble import HistGradientBoostingRegressor
+    except ImportError:
+        raise ImportError(f"FLOODSENSE_SCENARIO_HEAD=hist needs HistGradientBoostingRegressor, which scikit-learn "
+                          f"{sklearn.__version__} does not provide; upgrade scikit-learn (pip install 'scikit-learn>=1.0') "
+                          f"or use the gbr head")
+    return HistGradientBoostingRegressor(**SCENARIO_HIST_PARAMS)
+
+
+# Regressor heads, selected with FLOODSENSE_SCENARIO_HEAD
+SCENARIO_HEADS = {
+    "gbr": lambda: GradientBoostingRegressor(**SCENARIO_MODEL_PARAMS),
+    "hist": hist_regressor
+}
+
+
+def _fold_mse(model, X, y, train, test):
+    model.fit(X[train], y[train])
+    return float(np.mean((model.predict(X[test]) - y[test]) ** 2))
 
 class FloodScenarioModel:
-    def __init__(self):
-        self.tokenizer = BertTokenizer.from_pretrained("bert-base-uncased")
-        self.bert_model = BertModel.from_pretrained("bert-base-uncased")
-        self.bert_model.eval()
+    def __init__(self, embedding_cache=None, store=None, encoder=None, head=None, n_jobs=None, training_data=None,
+                 index=None):
+        # Text encoder backend (bert, bert-int8, distilbert, ...), chosen by FLOODSENSE_ENCODER.
+        # Each backend gets its own regressor head through the artifact fingerprint.
+        self.encoder = encoder if encoder is not None else create_encoder()
+
+        # Cache CLS embeddings so resubmitted scenario texts skip the BERT pass.
+        # Set FLOODSENSE_EMBEDDING_CACHE_DIR to share a persistent tier between workers.
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(
+                max_bytes=int(os.environ.get("FLOODSENSE_EMBEDDING_CACHE_BYTES", 64 * 1024 * 1024)),
+                disk_path=os.environ.get("FLOODSENSE_EMBEDDING_CACHE_DIR"),
+                namespace=self.encoder.name,
+                dim=getattr(self.encoder, "dim", None)
+            )
+        self.embedding_cache = embedding_cache
 
         self.labels = ["Urbanization", "Deforestation", "ClimateChange", "DrainageSystems", "DamsQuality"]
-        self.scaler_y = MinMaxScaler()
+        self.training_data = training_data if training_data is not None else SCENARIO_TRAINING_DATA
+        
+        # Regressor head and how many cores training may use (-1 for all of them).
+        # n_jobs only changes how fast training runs, not the fitted model
+        self.head = head or os.environ.get("FLOODSENSE_SCENARIO_HEAD", "gbr")
+        if self.head not in SCENARIO_HEADS:
+            raise ValueError(f"Unknown scenario head '{self.head}', expected one of {sorted(SCENARIO_HEADS)}")
+        # Fail at construction rather than after the corpus has been encoded
+        SCENARIO_HEADS[self.head]()
+        self.n_jobs = n_jobs if n_jobs is not None else int(os.environ.get("FLOODSENSE_TRAIN_N_JOBS", -1))
+        params = SCENARIO_MODEL_PARAMS if self.head == "gbr" else dict(SCENARIO_HIST_PARAMS, head=self.head)
         
-        # Check if the model already exists and load it, otherwise train a new one
-        model_path = 'flood_scenario_model.joblib'
-        if os.path.exists(model_path):
-            try:
-                self.model = joblib.load(model_path)
-                print("Loaded pre-trained scenario model")
-            except Exception as e:
-                print(f"Error loading model: {e}")
-                self._train_model()
-        else:
-            self._train_model()
+        # Load the regressor and its label scaler together from the artifact store,
+        # training only when the data, hyperparameters or encoder have changed
+        store = store or ArtifactStore()
+        key = fingerprint(self.training_data, params, self.encoder.name, sklearn.__version__)
+        bundle = store.load_or_build("scenario_model", key, self._train_model,
+                                     metadata={"params": params, "encoder": self.encoder.name})
+        self.model = bundle["model"]
+        self.scaler_y = bundle["scaler_y"]
+        self.cv_mse = bundle.get("cv_mse")
+        self.train_timings = bundle.get("timings")
+        self.version = store.version("scenario_model", key)
+        
+        # Optional ScenarioIndex of known scenarios. With FLOODSENSE_SCENARIO_INDEX_FAST_PATH=1
+        # a labelled exact or near-duplicate text skips the encoder and regressor, and
+        # FLOODSENSE_SCENARIO_INDEX_MIN_SIMILARITY snaps very close embeddings to their labels
+        self.index = index
+        self.index_fast_path = index is not None and os.environ.get("FLOODSENSE_SCENARIO_INDEX_FAST_PATH", "0") == "1"
+        min_similarity = os.environ.get("FLOODSENSE_SCENARIO_INDEX_MIN_SIMILARITY")
+        # Embedding similarities are only meaningful between vectors from the same encoder
+        self.index_min_similarity = (float(min_similarity) if min_similarity and self.index_fast_path
+                                     and index.encoder_name == self.encoder.name else None)
 
     def _encode(self, text):
-        with torch.no_grad():
-            tokens = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=128)
-            output = self.bert_model(**tokens)
-            return output.last_hidden_state[:, 0, :].squeeze().numpy()
+        emb = self.embedding_cache.get(text)
+        if emb is not None:
+            return emb
+        emb = self.encoder.encode([text])[0]
+        self.embedding_cache.put(text, emb)
+        return emb
+
+    def encode_batch(self, texts, batch_size=16):
+        """Encode many texts, running the encoder on length-sorted, dynamically padded mini-batches"""
+        embeddings = [self.embedding_cache.get(t) for t in texts]
+
+        # Only encode each distinct uncached text once
+        pending = {}
+        for i, emb in enumerate(embeddings):
+            if emb is None:
+                pending.setdefault(self.embedding_cache.key(texts[i]), []).append(i)
+
+        if pending:
+            unique = [texts[idx[0]] for idx in pending.values()]
+            encoded = self.encoder.encode(unique, batch_size=batch_size)
+            for text, positions, emb in zip(unique, pending.values(), encoded):
+                self.embedding_cache.put(text, emb)
+                for i in positions:
+                    embeddings[i] = emb
+
+        return np.array(embeddings)
 
     def _train_model(self):
-        # Expanded training data with more diverse scenarios
-        data = [
-            {"text": "Rapid urban sprawl and deforestation with failing drainage systems.", "labels": [9, 8, 6, 2, 4]},
-            {"text": "Rising sea levels and torrential rain from climate change.", "labels": [4, 3, 9, 3, 3]},
-            {"text": "Forest restoration and dam reinforcement in a temperate climate.", "labels": [2, 2, 4, 7, 9]},
-            {"text": "Extreme heat and drying wetlands with urban expansion and poor dams.", "labels": [7, 7, 9, 4, 2]},
-            {"text": "Excellent drainage and strong dam systems in low urban density areas.", "labels": [3, 3, 4, 9, 9]},
-            {"text": "Massive deforestation and heatwaves with weak infrastructure.", "labels": [6, 9, 8, 2, 3]},
-            {"text": "Reforestation efforts and green policies reduce climate impact.", "labels": [3, 2, 3, 8, 8]},
-            {"text": "Torrential rain due to warming oceans and blocked city drainage.", "labels": [6, 4, 9, 1, 4]},
-            # Additional scenarios to improve model robustness
-            {"text": "Urban development in floodplains with increased impervious surfaces.", "labels": [9, 5, 6, 3, 5]},
-            {"text": "Restoration of wetlands and natural water retention areas.", "labels": [4, 2, 5, 8, 7]},
-            {"text": "Aging dams and levees with deferred maintenance in areas with heavy rainfall.", "labels": [5, 4, 7, 5, 2]},
-            {"text": "Green infrastructure implementation with permeable surfaces in urban areas.", "labels": [6, 3, 5, 8, 6]},
-            {"text": "Coastal erosion with sea level rise and storm surges.", "labels": [5, 6, 9, 4, 3]},
-            {"text": "Mountain deforestation leading to increased runoff and soil erosion.", "labels": [6, 9, 7, 3, 4]},
-            {"text": "River basin management with integrated flood control measures.", "labels": [5, 4, 5, 8, 8]},
-            {"text": "Agricultural expansion with soil compaction and drainage modifications.", "labels": [7, 8, 6, 3, 4]},
-            {"text": "Dense urban centers with outdated stormwater systems.", "labels": [9, 4, 6, 2, 5]},
-            {"text": "Smart city development with rainfall capture and storage systems.", "labels": [8, 3, 5, 9, 7]},
-            {"text": "Severe drought followed by intense rainfall on dry soil.", "labels": [5, 6, 8, 4, 5]},
-            {"text": "Polar ice melting rapidly with stronger hurricanes.", "labels": [4, 5, 10, 3, 5]},
-            {"text": "Complete ecosystem restoration and nature-based solutions for flood management.", "labels": [2, 1, 3, 9, 8]},
-            {"text": "Catastrophic dam failure in area with extreme precipitation events.", "labels": [5, 6, 8, 5, 1]},
-            {"text": "Improved urban planning with flood-resilient building codes and zoning.", "labels": [6, 4, 5, 7, 7]}
-        ]
-
-        print("Training scenario model with", len(data), "examples")
+        data = self.training_data
+        print(f"Training scenario model ({self.head} head, n_jobs={self.n_jobs}) with", len(data), "examples")
+        timings = {}
         
-        X = np.array([self._encode(d["text"]) for d in data])
+        start = time.perf_counter()
+        X = self.encode_batch([d["text"] for d in data])
         y = np.array([d["labels"] for d in data])
-        y_scaled = self.scaler_y.fit_transform(y)
+        scaler_y = MinMaxScaler()
+        y_scaled = scaler_y.fit_transform(y)
+        timings["encode"] = time.perf_counter() - start
         
         # Create a more powerful model with gradient boosting
-        base_model = GradientBoostingRegressor(
-            n_estimators=100,
-            learning_rate=0.05,
-            max_depth=3,
-            min_samples_split=3,
-            loss='squared_error',
-            random_state=42
-        )
+        base_model = SCENARIO_HEADS[self.head]()
         
-        # Cross-validation to evaluate model quality
+        # Cross-validation to evaluate model quality; every (dimension, fold)
+        # pair is an independent fit, so they all run in parallel
+        start = time.perf_counter()
         kf = KFold(n_splits=5, shuffle=True, random_state=42)
-        cv_scores = []
-        
-        # Evaluate each output dimension separately
-        for i in range(y_scaled.shape[1]):
-            dim_scores = cross_val_score(base_model, X, y_scaled[:, i], cv=kf, scoring='neg_mean_squared_error')
-            cv_scores.append(-np.mean(dim_scores))  # Convert to positive MSE
+        folds = list(kf.split(X))
+        fold_mse = Parallel(n_jobs=self.n_jobs)(
+            delayed(_fold_mse)(clone(base_model), X, y_scaled[:, i], train, test)
+            for i in range(y_scaled.shape[1]) for train, test in folds
+        )
+        cv_scores = np.mean(np.reshape(fold_mse, (y_scaled.shape[1], len(folds))), axis=1)
+        timings["cross_validation"] = time.perf_counter() - start
             
         print(f"Cross-validation MSE by dimension: {np.round(cv_scores, 4)}")
         print(f"Mean MSE across dimensions: {np.round(np.mean(cv_scores), 4)}")
         
-        # Train final model on all data
-        self.model = MultiOutputRegressor(base_model)
-        self.model.fit(X, y_scaled)
+        # Train final model on all data, one output dimension per core
+        start = time.perf_counter()
+        model = MultiOutputRegressor(base_model, n_jobs=self.n_jobs)
+        model.fit(X, y_scaled)
+        # Prediction on one text at a time is faster without the worker pool
+        model.n_jobs = None
+        timings["fit"] = time.perf_counter() - start
         
-        # Save the trained model
-        joblib.dump(self.model, 'flood_scenario_model.joblib')
-        print("Model trained and saved to flood_scenario_model.joblib")
+        timings = {phase: round(seconds, 3) for phase, seconds in timings.items()}
+        print(f"Scenario model trained, seconds per phase: {timings}")
+        return {"model": model, "scaler_y": scaler_y, "cv_mse": [float(v) for v in cv_scores], "timings": timings}
 
     def predict(self, text):
-        emb = self._encode(text)
-        pred_scaled = self.model.predict([emb])[0]
-        scores = self.scaler_y.inverse_transform([pred_scaled])[0]
+        return self.predict_batch([text])[0]
+
+    def predict_batch(self, texts, batch_size=16):
+        """Predict scenario factors for many texts with one regressor call"""
+        if len(texts) == 0:
+            return []
+        known = [None] * len(texts)
+        if self.index_fast_path:
+            with stage("index_lookup"):
+                for i, text in enumerate(texts):
+                    match = self.index.match_text(text)
+                    known[i] = self.index.factors(match[0]) if match is not None else None
+        pending = [i for i, factors in enumerate(known) if factors is None]
+        scores = np.empty((len(texts), len(self.labels)))
+        for i, factors in enumerate(known):
+            if factors is not None:
+                scores[i] = [factors[label] for label in self.labels]
+        
+        if pending:
+            with stage("encode"):
+                embs = self.encode_batch([texts[i] for i in pending], batch_size=batch_size)
+            with stage("regressor"):
+                pred_scaled = self.model.predict(embs)
+                scores[pending] = self.scaler_y.inverse_transform(pred_scaled)
+            if self.index_min_similarity is not None:
+                with stage("index_lookup"):
+                    rows, similarities = self.index.search(embs, k=1)
+                for i, row, similarity in zip(pending, rows[:, 0], similarities[:, 0]):
+                    if similarity >= self.index_min_similarity and self.index.labelled[row]:
+                        scores[i] = [self.index.factors(row)[label] for label in self.labels]
         
         # Apply reasonable constraints to predictions
         scores = np.clip(scores, 1, 10)  # Ensure values stay in 1-10 range
         
         # Return rounded scores
-        return dict(zip(self.labels, np.round(scores, 2))) 
\ No newline at end of file
+        return [dict(zip(self.labels, row)) for row in np.round(scores, 2)] 
+
+def compare_encoder_backends(backends=None, repeats=3):
+    """Compare accuracy (cross-validated MSE) against latency and memory for each encoder backend"""
+    texts = [d["text"] for d in SCENARIO_TRAINING_DATA]
+    results = {}
+    for backend in backends or ENCODER_BACKENDS:
+        start = time.perf_counter()
+        encoder = create_encoder(backend)
+        load_seconds = time.perf_counter() - start
+
+        # Uncached model so the timings measure the encoder itself
+        model = FloodScenarioModel(embedding_cache=EmbeddingCache(max_bytes=0), encoder=encoder)
+
+        single = []
+        for _ in range(repeats):
+            for text in texts:
+                start = time.perf_counter()
+                encoder.encode([text])
+                single.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        encoder.encode(texts)
+        batch_seconds = time.perf_counter() - start
+
+        results[backend] = {
+            "cv_mse": round(float(np.mean(model.cv_mse)), 4) if model.cv_mse else None,
+            "latency_ms_p50": round(float(np.percentile(single, 50)) * 1000, 2),
+            "latency_ms_p95": round(float(np.percentile(single, 95)) * 1000, 2),
+            "batch_texts_per_second": round(len(texts) / batch_seconds, 1),
+            "weights_mb": round(encoder.size_bytes() / 1e6, 1),
+            "load_seconds": round(load_seconds, 2)
+        }
+        print(f"{backend}: {results[backend]}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Compare scenario encoder backends on the training scenarios")
+    parser.add_argument("--backends", nargs="*", choices=sorted(ENCODER_BACKENDS), default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(compare_encoder_backends(args.backends, args.repeats), indent=2))
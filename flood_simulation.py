@@ -0,0 +1,387 @@
+import importlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Order of the simulation state vector: four scaled environmental features
+# followed by the five climate/land-use factors on a 0-1 scale
+ENV_NAMES = ["Rainfall", "WaterLevel", "Humidity", "Temperature"]
+FACTOR_NAMES = ["ClimateChange", "Urbanization", "Deforestation", "DrainageSystems", "DamsQuality"]
+N_ENV = len(ENV_NAMES)
+
+# Improved drift factors based on scientific climate projections
+# Different factors have different rates of change and interdependencies
+BASE_DRIFT = np.array([0.03, 0.04, 0.015, 0.02, 0.01])  # Climate, Urban, Deforest, Drainage, Dams
+
+# Infrastructure factors degrade over time unless maintained, the rest grow
+DEGRADING = np.array([False, False, False, True, True])
+
+# Years of state history the CNN/LSTM network sees per prediction, oldest first
+SEQUENCE_LENGTH = 5
+
+
+class StateHistory:
+    """Ring buffer of the most recent states of every scenario
+
+    Each state is written twice, ``length`` rows apart, so the latest
+    ``length`` states are always one contiguous slice and ``window()`` is a
+    view rather than a copy.
+    """
+
+    def __init__(self, length, initial):
+        initial = np.asarray(initial, dtype=float)
+        if initial.ndim == 2:
+            initial = initial[np.newaxis]
+        self.length = length
+        self._buffer = np.empty((2 * length,) + initial.shape[1:])
+        self._pos = 0
+        # Until enough states exist the earliest one stands in for older years
+        for state in [initial[0]] * max(0, length - len(initial)) + list(initial[-length:]):
+            self.push(state)
+
+    def push(self, state):
+        self._buffer[self._pos] = state
+        self._buffer[self._pos + self.length] = state
+        self._pos = (self._pos + 1) % self.length
+
+    def extend(self, states):
+        for state in states[-self.length:]:
+            self.push(state)
+
+    def window(self):
+        """The last ``length`` states, oldest first, as a (length x scenarios x features) view"""
+        return self._buffer[self._pos:self._pos + self.length]
+
+
+def sequence_windows(states, history, length=SEQUENCE_LENGTH):
+    """Rolling windows of ``length`` states ending at each year of a (years x scenarios x 9) history
+
+    ``history`` holds the ``length - 1`` states that precede ``states[0]``.
+    The result is a strided (years x scenarios x length x 9) view of one
+    concatenated array, so no window is copied.
+    """
+    sequence = np.concatenate([history, states]) if len(history) else states
+    windows = np.lib.stride_tricks.sliding_window_view(sequence, length, axis=0)
+    return np.moveaxis(windows, -1, 2)
+
+
+def step_state(state, t, drift=BASE_DRIFT, dt=1):
+    """Advance a (scenarios x 9) state matrix by ``dt`` years (one by default) in place
+
+    ``t`` is the time in years, so sub-annual steps see the same regime changes.
+    """
+    factors = state[:, N_ENV:]
+
+    # Base drift modified by current value of the factor (logistic-like growth)
+    drift_modifier = np.ones_like(factors)
+    # Climate change accelerates over time (reinforcing loop)
+    if t > 10:
+        drift_modifier[:, 0] = 1.2
+    # Urban growth slows as it approaches capacity
+    drift_modifier[:, 1] = np.where(factors[:, 1] > 0.7, 0.7, drift_modifier[:, 1])
+
+    effective_drift = drift * drift_modifier * dt
+    factors[:] = np.where(DEGRADING,
+                          np.maximum(0, factors - effective_drift * 0.5),
+                          np.minimum(1.0, factors + effective_drift))
+
+    # Deforestation makes climate change worse
+    high_deforestation = factors[:, 2] > 0.6
+    factors[:, 0] = np.where(high_deforestation, np.minimum(1.0, factors[:, 0] + 0.01 * dt), factors[:, 0])
+    return state
+
+
+def simulate_states(x0, years, drift=BASE_DRIFT):
+    """Step every scenario forward and return the (years x scenarios x 9) state history"""
+    state = np.array(x0, dtype=float, ndmin=2)
+    states = np.empty((years,) + state.shape)
+    for t in range(years):
+        step_state(state, t, drift)
+        states[t] = state
+    return states
+
+
+def heuristic_risk(states, years, noise=None, t0=0, dt=1):
+    """Rule-based risk used when no trained model is available
+
+    Row ``i`` is at step ``t0 + i``, each step lasting ``dt`` years.
+    """
+    t = ((t0 + np.arange(len(states))) * dt).reshape(-1, 1)
+
+    # Good drainage systems reduce impact of urbanization,
+    # poor drainage amplifies urbanization effects
+    urban_impact = np.where(states[..., 7] > 0.7,
+                            np.maximum(0, states[..., 5] - 0.2),
+                            states[..., 5] * 1.2)
+    # Dam quality affects water level management
+    dam_effectiveness = states[..., 8]
+
+    rain_impact = states[..., 0] * 0.4
+    water_impact = states[..., 1] * 0.3 * (1.0 - (dam_effectiveness * 0.5))
+    # Humidity impact increases with temperature
+    humidity_temp_interaction = states[..., 2] * states[..., 3] * 0.3
+    env_risk = rain_impact + water_impact + humidity_temp_interaction
+
+    climate_impact = (states[..., 4] * 0.5 +
+                      urban_impact * 0.3 +
+                      states[..., 6] * 0.2)
+
+    # Higher weights for environmental factors in early years,
+    # climate factors gain importance over time
+    env_weight = 0.8 - (t / years * 0.3)
+    climate_weight = 1.0 - env_weight
+    risk = (env_risk * env_weight + climate_impact * climate_weight) * 10
+
+    # Small random variation representing unpredictable factors
+    if noise is None:
+        noise = np.random.normal(0, 0.1, size=risk.shape)
+    return np.clip(risk + noise, 0, 10)
+
+
+def score_states(states, years, scaler, risk_model=None, nn_model=None, noise=None, t0=0, history=None, dt=1):
+    """Score a (years x scenarios x 9) state history with a single batched model call
+
+    ``t0`` is the step of the first row, for histories scored in chunks, and
+    ``dt`` the years per step (rows are years by default).
+    ``history`` holds the states before ``states[0]`` (at least one, such as
+    the initial state) that fill the network's first sequence windows.
+    """
+    n_years, n_scenarios, n_features = states.shape
+    flat = states.reshape(-1, n_features)
+
+    if risk_model is not None:
+        # Inverse transform to get original scale for the trained model
+        env_orig = scaler.inverse_transform(flat[:, :N_ENV])
+        risks = np.clip(np.asarray(risk_model.predict(env_orig), dtype=float), 0, 10)
+    elif nn_model is not None:
+        x_cnn = flat.reshape(-1, 3, 3, 1)
+        if history is None:
+            history = states[:1]
+        lead_in = StateHistory(SEQUENCE_LENGTH - 1, history).window()
+        # Every year's window goes to the network in one batch
+        x_lstm = sequence_windows(states, lead_in).reshape(-1, SEQUENCE_LENGTH, n_features)
+        risks = np.asarray(nn_model.predict([x_cnn, x_lstm]), dtype=float).flatten() * 10
+    else:
+        return heuristic_risk(states, years, noise, t0, dt)
+    return risks.reshape(n_years, n_scenarios)
+
+
+def simulate(x0, years, scaler, risk_model=None, nn_model=None, drift=BASE_DRIFT, history=None):
+    """Run all scenarios in x0 forward and return (risks, states), both indexed [year, scenario]
+
+    ``history`` optionally holds observed states before x0, oldest first, for
+    the network's sequence windows.
+    """
+    x0 = np.array(x0, dtype=float, ndmin=2)
+    states = simulate_states(x0, years, drift)
+    lead_in = x0[np.newaxis] if history is None else np.concatenate([history, x0[np.newaxis]])
+    risks = score_states(states, years, scaler, risk_model, nn_model, history=lead_in)
+    return risks, states
+
+
+def hindcast(observed, years, scaler, risk_model=None, nn_model=None, drift=BASE_DRIFT):
+    """Score an observed (steps x scenarios x 9) state series, then simulate ``years`` on from its end
+
+    The network's windows slide over the real observations, and the forecast's
+    first windows are made of the last observed states. Returns
+    (observed_risks, forecast_risks, forecast_states).
+    """
+    observed = np.asarray(observed, dtype=float)
+    # No noise on the past: each observation is scored as it was
+    observed_risks = score_states(observed, len(observed), scaler, risk_model, nn_model, noise=0.0)
+    if years < 1:
+        return observed_risks, np.empty((0, observed.shape[1])), np.empty((0,) + observed.shape[1:])
+    forecast_risks, states = simulate(observed[-1], years, scaler, risk_model, nn_model, drift, history=observed[:-1])
+    return observed_risks, forecast_risks, states
+
+
+def iter_simulation(x0, years, scaler, risk_model=None, nn_model=None, drift=BASE_DRIFT, chunk_years=10,
+                    steps_per_year=1, noise=None):
+    """Generator version of simulate() yielding (first_step, risks, states) chunks
+
+    Only one chunk is held in memory at a time and each chunk is scored with one
+    batched model call, so long horizons stream with flat memory use. A ring
+    buffer carries the last few states into the next chunk's sequence windows.
+    With ``steps_per_year`` > 1 (4 for seasons, 12 for months) each step
+    advances a fraction of a year and drift is scaled to match. ``noise`` is
+    passed to the rule-based fallback, e.g. 0.0 for deterministic risks.
+    """
+    state = np.array(x0, dtype=float, ndmin=2)
+    recent = StateHistory(SEQUENCE_LENGTH - 1, state)
+    dt = 1 if steps_per_year == 1 else 1.0 / steps_per_year
+    n_steps = years * steps_per_year
+    chunk_steps = max(1, chunk_years * steps_per_year)
+    for start in range(0, n_steps, chunk_steps):
+        n = min(chunk_steps, n_steps - start)
+        states = np.empty((n,) + state.shape)
+        for k in range(n):
+            step_state(state, (start + k) * dt, drift, dt)
+            states[k] = state
+        yield start, score_states(states, years, scaler, risk_model, nn_model, noise, t0=start,
+                                  history=recent.window(), dt=dt), states
+        recent.extend(states)
+
+
+class SeriesAggregator:
+    """Streaming min, mean and max of a (steps x scenarios) series per period of ``period`` steps
+
+    Chunks are added in step order and only the running totals of the open
+    period are kept, so memory depends on the number of periods, never on
+    the number of steps.
+    """
+
+    def __init__(self, period):
+        self.period = period
+        self.periods = []
+        self._first = 0
+        self._count = 0
+        self._sum = self._min = self._max = None
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        pos = 0
+        while pos < len(values):
+            segment = values[pos:pos + self.period - self._count]
+            if self._count == 0:
+                self._sum, self._min, self._max = segment.sum(axis=0), segment.min(axis=0), segment.max(axis=0)
+            else:
+                self._sum = self._sum + segment.sum(axis=0)
+                self._min = np.minimum(self._min, segment.min(axis=0))
+                self._max = np.maximum(self._max, segment.max(axis=0))
+            self._count += len(segment)
+            pos += len(segment)
+            if self._count == self.period:
+                self._close()
+
+    def _close(self):
+        self.periods.append({"first_step": self._first, "steps": self._count, "min": self._min,
+                             "mean": self._sum / self._count, "max": self._max})
+        self._first += self._count
+        self._count = 0
+
+    def finish(self):
+        """Close a final partial period and return every period"""
+        if self._count:
+            self._close()
+        return self.periods
+
+
+# Monte Carlo ensembles are split into fixed-size chunks, each with its own
+# spawned seed, so results do not depend on how many worker processes run them
+ENSEMBLE_CHUNK = 1000
+MAX_ENSEMBLE_MEMBERS = 20000
+PERCENTILES = (5, 50, 95)
+
+
+# One pool per process, started on warm-up or first use and reused by every ensemble after it
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Networks loaded by pool workers, by file path
+_worker_networks = {}
+
+
+def ensemble_pool(n_jobs):
+    """The process pool shared by every ensemble in this process
+
+    Workers are spawned rather than forked, so they never inherit a server's
+    threads or TensorFlow state, and they live as long as the process. A
+    forked child gets its own pool; the parent's cannot be used from it.
+    """
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=n_jobs, mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _worker_ready(modules):
+    for name in modules:
+        importlib.import_module(name)
+    return os.getpid()
+
+
+def warm_up_pool(n_jobs, modules=()):
+    """Start the shared pool and spawn all of its workers without waiting for them
+
+    Each spawned worker re-imports the modules it needs, including the ones
+    named in ``modules`` that define the pickled arguments, which takes
+    seconds; doing it ahead of time keeps that cost off the first ensemble.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    pool = ensemble_pool(n_jobs)
+    # The executor adds a worker for every task submitted while none is idle
+    return [pool.submit(_worker_ready, tuple(modules)) for _ in range(n_jobs)]
+
+
+def _worker_network(nn_model):
+    """A network given as a file path is loaded once per pool worker and kept"""
+    if not isinstance(nn_model, str):
+        return nn_model
+    if nn_model not in _worker_networks:
+        import tensorflow as tf
+        _worker_networks[nn_model] = tf.keras.models.load_model(nn_model)
+    return _worker_networks[nn_model]
+
+
+def _ensemble_chunk(x0, years, n_members, seed, drift_sd, factor_sd, scaler, risk_model, nn_model):
+    """Simulate one chunk of perturbed ensemble members"""
+    nn_model = _worker_network(nn_model)
+    rng = np.random.default_rng(seed)
+
+    # Perturb the drift rates multiplicatively and the initial factors additively
+    drift = BASE_DRIFT * np.clip(1.0 + rng.normal(0, drift_sd, size=(n_members, len(BASE_DRIFT))), 0, None)
+    state = np.repeat(np.asarray(x0, dtype=float)[np.newaxis, :], n_members, axis=0)
+    perturbation = rng.normal(0, factor_sd / 10.0, size=(n_members, len(FACTOR_NAMES)))
+    state[:, N_ENV:] = np.clip(state[:, N_ENV:] + perturbation, 0, 1.0)
+
+    states = simulate_states(state, years, drift)
+    noise = rng.normal(0, 0.1, size=(years, n_members))
+    risks = score_states(states, years, scaler, risk_model, nn_model, noise, history=state[np.newaxis])
+    return risks, states[:, :, N_ENV:] * 10
+
+
+def run_ensemble(x0, years, scaler, risk_model=None, nn_model=None, members=1000,
+                 drift_sd=0.25, factor_sd=1.0, seed=None, n_jobs=1, nn_model_path=None):
+    """Run a seeded Monte Carlo ensemble and return p5/p50/p95 bands per year
+
+    Chunks run in this process unless ``n_jobs`` > 1 (None for every core),
+    which sends them to the shared process pool. Pool workers load the network
+    from ``nn_model_path`` instead of receiving the model object; without a
+    path an ensemble scored by the network stays in this process.
+    """
+    members = int(min(max(members, 1), MAX_ENSEMBLE_MEMBERS))
+    sizes = [min(ENSEMBLE_CHUNK, members - start) for start in range(0, members, ENSEMBLE_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(sizes))
+    if nn_model is not None and risk_model is None and nn_model_path is None:
+        n_jobs = 1
+    if n_jobs > 1:
+        # Only the trained risk model's arrays are pickled; the network goes by path
+        network = nn_model_path if nn_model is not None else None
+        jobs = [(x0, years, size, child, drift_sd, factor_sd, scaler, risk_model, network)
+                for size, child in zip(sizes, seeds)]
+        results = list(ensemble_pool(n_jobs).map(_ensemble_chunk, *zip(*jobs)))
+    else:
+        results = [_ensemble_chunk(x0, years, size, child, drift_sd, factor_sd, scaler, risk_model, nn_model)
+                   for size, child in zip(sizes, seeds)]
+
+    risks = np.concatenate([r for r, _ in results], axis=1)
+    factors = np.concatenate([f for _, f in results], axis=1)
+
+    def bands(values):
+        return {f"p{p}": [round(float(v), 2) for v in row]
+                for p, row in zip(PERCENTILES, np.percentile(values, PERCENTILES, axis=1))}
+
+    return {
+        "members": members,
+        "seed": seed,
+        "risks": bands(risks),
+        "feature_trajectories": {name: bands(factors[:, :, i]) for i, name in enumerate(FACTOR_NAMES)}
+    }
@@ -0,0 +1,33 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+
+import serving
+
+bind = os.environ.get("FLOODSENSE_BIND", "0.0.0.0:5000")
+
+# One process per core, each with its share of native threads
+workers = serving.worker_count()
+
+# Import wsgi, and so load every model, once in the master before forking,
+# so all workers share the read-only weights copy-on-write
+preload_app = os.environ.get("FLOODSENSE_PRELOAD", "1") == "1"
+
+# Bounded concurrency: each worker handles at most this many requests at once,
+# and further connections wait in the listen backlog
+worker_class = "gthread"
+threads = int(os.environ.get("FLOODSENSE_WORKER_CONNECTIONS", 4))
+backlog = int(os.environ.get("FLOODSENSE_BACKLOG", 256))
+
+# Graceful shutdown: on SIGTERM workers stop accepting and finish in-flight requests
+timeout = int(os.environ.get("FLOODSENSE_TIMEOUT", 120))
+graceful_timeout = int(os.environ.get("FLOODSENSE_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Recycle workers now and then to bound memory growth, staggered so they do not restart together
+max_requests = int(os.environ.get("FLOODSENSE_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+
+
+def post_fork(server, worker):
+    serving.after_fork()
+    worker.log.info(f"Worker {worker.pid} limited to {serving.threads_per_worker()} native threads")
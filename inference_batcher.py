@@ -0,0 +1,73 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFullError(Exception):
+    """Raised when the batcher already holds its maximum number of pending requests"""
+
+
+class MicroBatcher:
+    """Collects concurrent single-item requests and runs them as one batch
+
+    A background thread waits for the first pending item, then gathers more
+    for up to ``max_wait_ms`` or until ``max_batch_size`` items are queued,
+    calls ``predict_batch`` once and hands each caller its own result.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=16, max_wait_ms=5, max_queue=256, name="batcher"):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """Queue one item and block until its result is ready"""
+        future = Future()
+        try:
+            self._queue.put_nowait((item, future))
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFullError(f"Inference queue is full ({self._queue.maxsize} pending requests)")
+        return future.result(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.predict_batch(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self.batches += 1
+            self.items += len(batch)
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,80 @@
+import itertools
+
+import numpy as np
+
+
+class GridTable:
+    """A function of a few bounded inputs, tabulated on a regular grid
+
+    Lookups use multilinear interpolation between the 2**d corners of the
+    cell around the point, so their cost is independent of the model that
+    produced the table. Inputs outside the grid are clamped to its edges;
+    NaN or infinite inputs raise ``ValueError``.
+    """
+
+    def __init__(self, lows, highs, values, max_error=None):
+        self.lows = np.asarray(lows, dtype=np.float64)
+        self.highs = np.asarray(highs, dtype=np.float64)
+        self.values = values
+        self.max_error = max_error
+        self.shape = np.array(values.shape)
+        self.steps = (self.highs - self.lows) / (self.shape - 1)
+
+        # Offsets of every cell corner in the flattened table, and which
+        # corners take the upper side of each dimension
+        self.strides = np.asarray([int(np.prod(self.shape[d + 1:])) for d in range(len(self.shape))])
+        self._upper = np.array(list(itertools.product((0, 1), repeat=len(self.shape))), dtype=bool)
+        self._corner_offsets = self._upper.astype(np.intp) @ self.strides
+        self._flat = values.reshape(-1)
+
+    @classmethod
+    def build(cls, fn, lows, highs, points, dtype=np.float32):
+        """Evaluate ``fn`` on every grid point with one batched call"""
+        axes = [np.linspace(lo, hi, n) for lo, hi, n in zip(lows, highs, points)]
+        grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, len(axes))
+        values = np.asarray(fn(grid), dtype=dtype).reshape(tuple(points))
+        return cls(lows, highs, values)
+
+    @staticmethod
+    def _finite(x):
+        # Clamping leaves NaN in place and it would then index outside the table
+        x = np.asarray(x, dtype=np.float64)
+        if not np.isfinite(x).all():
+            raise ValueError("Interpolation inputs must be finite")
+        return x
+
+    def interpolate(self, x):
+        """Interpolated value at one point"""
+        x = self._finite(x)
+        position = (np.clip(x, self.lows, self.highs) - self.lows) / self.steps
+        cell = np.minimum(position.astype(np.intp), self.shape - 2)
+        fraction = position - cell
+        weights = np.where(self._upper, fraction, 1.0 - fraction).prod(axis=1)
+        return float(weights @ self._flat[cell @ self.strides + self._corner_offsets])
+
+    def interpolate_batch(self, X):
+        """Interpolated values at many points"""
+        X = self._finite(X)
+        position = (np.clip(X, self.lows, self.highs) - self.lows) / self.steps
+        cell = np.minimum(position.astype(np.intp), self.shape - 2)
+        fraction = position - cell
+        weights = np.where(self._upper, fraction[:, np.newaxis, :], 1.0 - fraction[:, np.newaxis, :]).prod(axis=2)
+        corners = self._flat[(cell @ self.strides)[:, np.newaxis] + self._corner_offsets]
+        return (weights * corners).sum(axis=1)
+
+    def measure_error(self, fn, samples=20000, seed=0):
+        """Largest absolute difference from ``fn`` over random points and cell centres
+
+        Cell centres are where multilinear interpolation is furthest from the
+        grid points, so together with uniformly random points this estimates
+        the worst-case error; it is an empirical bound, not a proof.
+        """
+        rng = np.random.default_rng(seed)
+        cells = rng.integers(0, self.shape - 1, size=(samples, len(self.lows)))
+        X = np.concatenate([
+            rng.uniform(self.lows, self.highs, size=(samples, len(self.lows))),
+            self.lows + (cells + 0.5) * self.steps
+        ])
+        errors = np.abs(self.interpolate_batch(X) - np.asarray(fn(X), dtype=np.float64).reshape(-1))
+        self.max_error = float(errors.max())
+        return self.max_error
@@ -0,0 +1,95 @@
+import threading
+import time
+import traceback
+
+# Load states reported by /healthz and /readyz
+NOT_LOADED = "not_loaded"
+LOADING = "loading"
+READY = "ready"
+UNAVAILABLE = "unavailable"  # The loader ran but there is nothing to load (e.g. no model file)
+FAILED = "failed"
+
+SETTLED_STATES = (READY, UNAVAILABLE, FAILED)
+
+
+class LazyModel:
+    """Holds a model that is only built the first time it is needed
+
+    ``loader`` is called at most once, from whichever thread asks first or from
+    a background warm-up thread. A loader returning ``None`` marks the model as
+    unavailable so callers can use their fallbacks without retrying.
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.state = NOT_LOADED
+        self.error = None
+        self.load_seconds = None
+        self._value = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get(self, wait=True):
+        """Return the loaded model, or None if it is unavailable
+
+        With ``wait=False`` a model that is not ready yet starts loading in the
+        background and ``None`` is returned immediately.
+        """
+        if self.state in SETTLED_STATES:
+            return self._value
+        if not wait:
+            self.warm_up()
+            return None
+
+        with self._lock:
+            if self.state not in SETTLED_STATES:
+                self._load()
+        return self._value
+
+    def _load(self):
+        self.state = LOADING
+        start = time.perf_counter()
+        try:
+            value = self.loader()
+        except Exception as e:
+            print(f"Error loading {self.name}: {e}")
+            traceback.print_exc()
+            self.error = str(e)
+            value = None
+            state = FAILED
+        else:
+            state = READY if value is not None else UNAVAILABLE
+        self.load_seconds = time.perf_counter() - start
+        self._value = value
+        self.state = state
+
+    def warm_up(self):
+        """Start loading in a background thread if nobody has started yet"""
+        with self._lock:
+            if self.state != NOT_LOADED or self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.get, name=f"warmup-{self.name}", daemon=True)
+            self._thread.start()
+
+    def replace(self, value):
+        """Swap in a model built elsewhere, e.g. after retraining
+
+        Readers never take the lock once a model has loaded, so they see
+        either the old or the new object, never a partial swap.
+        """
+        with self._lock:
+            self._value = value
+            self.error = None
+            self.state = READY if value is not None else UNAVAILABLE
+
+    @property
+    def settled(self):
+        return self.state in SETTLED_STATES
+
+    def status(self):
+        return {
+            "state": self.state,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "error": self.error
+        }
@@ -0,0 +1,154 @@
+"""Which model version every worker should serve, with history for rollback
+
+The registry is one small JSON file next to the artifacts. Retraining
+publishes a new active version there, and each worker notices the change with
+a cheap ``stat`` and swaps its models in the background:
+
+    python model_registry.py status
+    python model_registry.py rollback flood_risk_model
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from model_store import ARTIFACT_DIR, fingerprint
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+# Earlier versions kept per model for rollback
+HISTORY_LIMIT = 10
+
+
+class ModelRegistry:
+    """Active version and rollback history of each named model
+
+    An entry records the artifact ``version``, the ``data`` its training data
+    was snapshotted to (None for the data bundled with the app) and any
+    validation results. Writes replace the file atomically under a lock, so
+    readers never see a partial registry.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+        self.path = os.path.join(root, "registry.json")
+        self._seen = None
+
+    @contextmanager
+    def lock(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, "registry.lock"), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, registry):
+        fd, staging = tempfile.mkstemp(prefix=".registry-", suffix=".tmp", dir=self.root)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(registry, f, indent=2, default=str)
+            os.replace(staging, self.path)
+        except OSError:
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
+
+    def active(self, name):
+        """The active entry for ``name``, or None while the bundled default is in use"""
+        return self.read().get(name, {}).get("active")
+
+    def activate(self, name, entry, previous=None):
+        """Make ``entry`` the active version, keeping the current one for rollback
+
+        ``previous`` describes the version being replaced when the registry
+        has no entry for it yet, i.e. the default the app started with.
+        """
+        with self.lock():
+            registry = self.read()
+            record = registry.setdefault(name, {"active": None, "history": []})
+            current = record["active"] or previous
+            if current is not None:
+                record["history"] = ([current] + record["history"])[:HISTORY_LIMIT]
+            record["active"] = dict(entry, activated=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            self._write(registry)
+        return record["active"]
+
+    def rollback(self, name):
+        """Reactivate the version before the active one"""
+        with self.lock():
+            registry = self.read()
+            record = registry.get(name)
+            if not record or not record["history"]:
+                raise ValueError(f"No earlier version of {name} to roll back to")
+            rolled_back = record["active"]
+            record["active"] = dict(record["history"].pop(0),
+                                    activated=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            self._write(registry)
+        print(f"Rolled {name} back from {rolled_back['version']} to {record['active']['version']}")
+        return record["active"]
+
+    def changed(self):
+        """True when the registry file changed since the last call; costs one stat"""
+        try:
+            stat = os.stat(self.path)
+            seen = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except OSError:
+            seen = None
+        changed = seen != self._seen
+        self._seen = seen
+        return changed
+
+    def snapshot_data(self, name, source_path, suffix):
+        """Copy a training data file into the artifact directory under its content hash
+
+        Registry entries point at these immutable copies, so every worker and
+        a later rollback trains or loads from exactly the same data.
+        """
+        directory = os.path.join(self.root, "data")
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, f"{name}-{fingerprint(source_path)[:12]}{suffix}")
+        if not os.path.exists(target):
+            fd, staging = tempfile.mkstemp(prefix=".", suffix=suffix, dir=directory)
+            os.close(fd)
+            shutil.copyfile(source_path, staging)
+            os.replace(staging, target)
+        return target
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "rollback"])
+    parser.add_argument("name", nargs="?", help="model to roll back, e.g. flood_risk_model or scenario_model")
+    parser.add_argument("--root", default=ARTIFACT_DIR, help="artifact directory holding registry.json")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == "rollback":
+        if not args.name:
+            parser.error("rollback needs the name of a model")
+        try:
+            registry.rollback(args.name)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    print(json.dumps(registry.read(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
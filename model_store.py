@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+
+ARTIFACT_DIR = os.environ.get("FLOODSENSE_ARTIFACT_DIR", "artifacts")
+
+
+def fingerprint(*parts):
+    """Hash training data and hyperparameters into a stable artifact key
+
+    Each part may be bytes, a path to a file, or any JSON-serializable value.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            h.update(part)
+        elif isinstance(part, str) and os.path.isfile(part):
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        else:
+            h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ArtifactStore:
+    """Versioned model bundles on disk, one directory per name and fingerprint
+
+    A bundle is a dict of fitted objects saved uncompressed with joblib so its
+    NumPy arrays can be memory-mapped on load and shared between workers.
+    """
+
+    def __init__(self, root=ARTIFACT_DIR):
+        self.root = root
+
+    def version(self, name, key):
+        return f"{name}-{key[:12]}"
+
+    def path(self, name, key):
+        return os.path.join(self.root, self.version(name, key))
+
+    def load(self, name, key):
+        """Return the saved bundle, or None if there is no artifact for this key"""
+        bundle_path = os.path.join(self.path(name, key), "bundle.joblib")
+        if not os.path.exists(bundle_path):
+            return None
+        return joblib.load(bundle_path, mmap_mode="r")
+
+    def save(self, name, key, bundle, metadata=None):
+        """Write a bundle atomically so concurrent readers never see a partial artifact"""
+        os.makedirs(self.root, exist_ok=True)
+        target = self.path(name, key)
+        staging = tempfile.mkdtemp(prefix=f".{name}-", dir=self.root)
+        try:
+            joblib.dump(bundle, os.path.join(staging, "bundle.joblib"))
+            with open(os.path.join(staging, "manifest.json"), "w") as f:
+                json.dump({
+                    "name": name,
+                    "fingerprint": key,
+                    "version": self.version(name, key),
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "metadata": metadata or {}
+                }, f, indent=2, default=str)
+            os.replace(staging, target)
+        except OSError:
+            # Another process already published the same version
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.exists(target):
+                raise
+        return target
+
+    def load_or_build(self, name, key, build, metadata=None):
+        """Load the bundle for ``key``, building and saving it only if it is missing"""
+        try:
+            bundle = self.load(name, key)
+        except Exception as e:
+            print(f"Error loading {self.version(name, key)}, rebuilding: {e}")
+            shutil.rmtree(self.path(name, key), ignore_errors=True)
+            bundle = None
+        if bundle is not None:
+            print(f"Loaded {self.version(name, key)} from {self.root}")
+            return bundle
+
+        bundle = build()
+        self.save(name, key, bundle, metadata)
+        print(f"Saved {self.version(name, key)} to {self.root}")
+        return bundle
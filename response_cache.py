@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the shared store works but cannot coalesce across processes
+    fcntl = None
+
+
+def cache_key(*parts):
+    """Stable hash of JSON-serializable key parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def quantize(value, step):
+    """Round a value to the nearest multiple of ``step`` so nearby inputs share a key"""
+    return round(round(float(value) / step) * step, 6)
+
+
+class SharedResponseStore:
+    """One JSON file per key in a directory shared by the worker processes of a host
+
+    Computing a key takes an exclusive lock on that key, so when several
+    processes miss on the same key only the first computes and the others
+    read its result once the lock is released.
+    """
+
+    def __init__(self, path, prune_every=256):
+        self.path = path
+        self.prune_every = prune_every
+        self._writes = 0
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._file(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires"] < time.time():
+            return None
+        return entry["value"]
+
+    def put(self, key, value, ttl):
+        fd, staging = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=self.path)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"expires": time.time() + ttl, "value": value}, f)
+            os.replace(staging, self._file(key))
+        except OSError:
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
+        self._writes += 1
+        if self._writes % self.prune_every == 0:
+            self.prune()
+
+    @contextmanager
+    def lock(self, key):
+        path = os.path.join(self.path, f"{key}.lock")
+        while True:
+            lock = open(path, "a")
+            if fcntl is None:
+                break
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # prune() may have removed the file while we waited; then lock the new one
+            try:
+                if os.fstat(lock.fileno()).st_ino == os.stat(path).st_ino:
+                    break
+            except OSError:
+                pass
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            lock.close()
+
+    def _remove_idle_lock(self, path):
+        """Delete a lock file only while holding it, so no process is computing under it"""
+        try:
+            with open(path, "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                try:
+                    os.remove(path)
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+        except OSError:  # Held by another process, or already gone
+            pass
+
+    def prune(self):
+        """Remove expired entries, and idle lock files without a live entry, so the directory stays bounded"""
+        now = time.time()
+        live = set()
+        names = os.listdir(self.path)
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.path, name)) as f:
+                    expired = json.load(f)["expires"] < now
+                if expired:
+                    os.remove(os.path.join(self.path, name))
+                else:
+                    live.add(name[:-len(".json")])
+            except (OSError, ValueError, KeyError):
+                continue
+        # Without flock nothing guards a lock file, so they are left alone
+        if fcntl is None:
+            return
+        for name in names:
+            if name.endswith(".lock") and name[:-len(".lock")] not in live:
+                self._remove_idle_lock(os.path.join(self.path, name))
+
+
+class ResponseCache:
+    """In-process LRU cache with a TTL and request coalescing for API responses
+
+    Values must be JSON-serializable and are treated as read-only. Concurrent
+    misses on one key wait for a single computation; with ``shared_path`` the
+    results are also shared, and computed once, across worker processes.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300, shared_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = SharedResponseStore(shared_path) if shared_path else None
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, ttl_of=None):
+        """Return ``(value, source)`` where source is hit, shared, coalesced or miss
+
+        ``ttl_of(value)``, if given, sets the TTL of a freshly computed value,
+        e.g. a shorter one for a degraded fallback; 0 leaves it uncached.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, "hit"
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            # Errors are not cached, but every waiting request sees the same one
+            return future.result(), "coalesced"
+
+        try:
+            value, source = self._compute(key, compute, ttl_of)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            # Publish before releasing the key so no request slips in between and recomputes
+            ttl = self.ttl if ttl_of is None else min(self.ttl, ttl_of(value))
+            if ttl > 0:
+                self.put(key, value, ttl)
+            future.set_result(value)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        return value, source
+
+    def _compute(self, key, compute, ttl_of=None):
+        if self.shared is None:
+            with self._lock:
+                self.misses += 1
+            return compute(), "miss"
+
+        value = self.shared.get(key)
+        if value is None:
+            with self.shared.lock(key):
+                # Another process may have finished this key while we waited for the lock
+                value = self.shared.get(key)
+                if value is None:
+                    with self._lock:
+                        self.misses += 1
+                    value = compute()
+                    ttl = self.ttl if ttl_of is None else min(self.ttl, ttl_of(value))
+                    if ttl > 0:
+                        self.shared.put(key, value, ttl)
+                    return value, "miss"
+        with self._lock:
+            self.shared_hits += 1
+        return value, "shared"
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.coalesced + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "shared": self.shared is not None,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "coalesced": self.coalesced,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.shared_hits + self.coalesced) / lookups if lookups else 0.0
+            }
@@ -0,0 +1,178 @@
+"""Compute a flood risk raster from gridded environmental inputs
+
+The four input grids are memory-mapped and scored tile by tile in a process
+pool, so grids larger than RAM scale with the number of cores:
+
+    python risk_map.py --rainfall rain.npy --water-level level.npy \\
+        --humidity humidity.npy --temperature temp.npy --output risk.npy
+
+Inputs may also be raw binary files given with --raw-shape and --raw-dtype.
+The risk raster (0-10, float32, NaN where any input is missing) is written as
+.npy and per-tile summary statistics as JSON next to it.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from flood_simulation import ENV_NAMES, FACTOR_NAMES, N_ENV, score_states
+
+# Cells at or above this risk count towards a tile's high-risk fraction
+HIGH_RISK = 7.0
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+
+def open_grid(path, shape=None, dtype="float32"):
+    """Memory-map an .npy file, or a raw binary file when ``shape`` is given"""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if shape is None:
+        raise ValueError(f"{path} is not an .npy file, pass --raw-shape to read it as raw binary")
+    return np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+
+
+def tile_windows(shape, tile_size):
+    """Yield (row, col, height, width) windows covering a grid"""
+    rows, cols = shape
+    for row in range(0, rows, tile_size):
+        for col in range(0, cols, tile_size):
+            yield row, col, min(tile_size, rows - row), min(tile_size, cols - col)
+
+
+def _init_worker(input_paths, output_path, shape, dtype, factors):
+    # Imported here so each worker loads the model bundle itself; the bundle is
+    # memory-mapped from the artifact store, so workers share its pages
+    import server
+    risk_model = server.flood_risk_model.get()
+    _worker.update(
+        grids=[open_grid(path, shape, dtype) for path in input_paths],
+        output=np.load(output_path, mmap_mode="r+"),
+        scaler=server.scaler.get(),
+        risk_model=risk_model,
+        # TensorFlow is only loaded when there is no trained risk model to use
+        nn_model=server.nn_model.get() if risk_model is None else None,
+        factors=np.asarray(factors, dtype=float) / 10.0
+    )
+
+
+def score_tile(window):
+    """Score one tile into the output raster and return its summary statistics"""
+    row, col, height, width = window
+    rows, cols = slice(row, row + height), slice(col, col + width)
+    env = np.stack([np.asarray(grid[rows, cols], dtype=float).ravel() for grid in _worker["grids"]], axis=1)
+    valid = np.isfinite(env).all(axis=1)
+
+    # Each cell is scored as year 0 of a one-scenario simulation
+    risk = np.full(len(env), np.nan)
+    if valid.any():
+        states = np.empty((1, int(valid.sum()), N_ENV + len(FACTOR_NAMES)))
+        states[0, :, :N_ENV] = _worker["scaler"].transform(env[valid])
+        states[0, :, N_ENV:] = _worker["factors"]
+        risk[valid] = score_states(states, 1, _worker["scaler"], _worker["risk_model"], _worker["nn_model"], noise=0.0)[0]
+
+    output = _worker["output"]
+    output[rows, cols] = risk.reshape(height, width)
+    output.flush()
+
+    stats = {"row": row, "col": col, "height": height, "width": width, "valid": int(valid.sum())}
+    if valid.any():
+        values = risk[valid]
+        stats.update(
+            min=round(float(values.min()), 4),
+            mean=round(float(values.mean()), 4),
+            max=round(float(values.max()), 4),
+            p95=round(float(np.percentile(values, 95)), 4),
+            high_risk_fraction=round(float((values >= HIGH_RISK).mean()), 4)
+        )
+    return stats
+
+
+def summarize_tiles(tiles):
+    """Whole-grid statistics from the per-tile ones"""
+    scored = [t for t in tiles if t["valid"]]
+    valid = sum(t["valid"] for t in scored)
+    if not valid:
+        return {"valid": 0}
+    return {
+        "valid": valid,
+        "min": min(t["min"] for t in scored),
+        "mean": round(sum(t["mean"] * t["valid"] for t in scored) / valid, 4),
+        "max": max(t["max"] for t in scored),
+        "high_risk_fraction": round(sum(t["high_risk_fraction"] * t["valid"] for t in scored) / valid, 4)
+    }
+
+
+def build_risk_map(input_paths, output_path, tile_size=512, jobs=None, shape=None, dtype="float32", factors=None):
+    """Score every tile of the input grids and return the per-tile statistics"""
+    factors = factors or [5.0] * len(FACTOR_NAMES)
+    grids = [open_grid(path, shape, dtype) for path in input_paths]
+    grid_shape = grids[0].shape
+    for name, grid in zip(ENV_NAMES, grids):
+        if grid.shape != grid_shape or grid.ndim != 2:
+            raise ValueError(f"{name} grid has shape {grid.shape}, expected a 2-D grid of {grid_shape}")
+
+    # Workers write their tiles straight into this memory-mapped raster
+    np.lib.format.open_memmap(output_path, mode="w+", dtype=np.float32, shape=grid_shape).flush()
+
+    windows = list(tile_windows(grid_shape, tile_size))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(input_paths, output_path, shape, dtype, factors)) as pool:
+        return list(pool.map(score_tile, windows, chunksize=max(1, len(windows) // (8 * (jobs or os.cpu_count() or 1)))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute a flood risk raster from gridded inputs")
+    parser.add_argument("--rainfall", required=True, help="Rainfall grid (mm)")
+    parser.add_argument("--water-level", required=True, help="Water level grid (m)")
+    parser.add_argument("--humidity", required=True, help="Humidity grid (%%)")
+    parser.add_argument("--temperature", required=True, help="Temperature grid (°C)")
+    parser.add_argument("--output", required=True, help="Risk raster to write (.npy)")
+    parser.add_argument("--stats", help="Per-tile statistics JSON (default: next to the output)")
+    parser.add_argument("--tile-size", type=int, default=512)
+    parser.add_argument("--jobs", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--raw-shape", type=int, nargs=2, metavar=("ROWS", "COLS"),
+                        help="Shape of raw binary (non-.npy) input grids")
+    parser.add_argument("--raw-dtype", default="float32", help="dtype of raw binary input grids")
+    parser.add_argument("--factor", action="append", default=[], metavar="NAME=VALUE",
+                        help=f"Climate factor on a 1-10 scale, one of {', '.join(FACTOR_NAMES)} (default 5)")
+    args = parser.parse_args()
+
+    factor_values = dict.fromkeys(FACTOR_NAMES, 5.0)
+    for item in args.factor:
+        name, _, value = item.partition("=")
+        if name not in factor_values:
+            parser.error(f"unknown factor '{name}', expected one of {FACTOR_NAMES}")
+        factor_values[name] = float(value)
+
+    input_paths = [os.path.abspath(p) for p in (args.rainfall, args.water_level, args.humidity, args.temperature)]
+    output_path = os.path.abspath(args.output)
+    stats_path = os.path.abspath(args.stats or os.path.splitext(args.output)[0] + "_tiles.json")
+
+    # The risk model bundle is found relative to the repository, as in the server
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    start = time.perf_counter()
+    tiles = build_risk_map(input_paths, output_path, args.tile_size, args.jobs,
+                           args.raw_shape, args.raw_dtype, [factor_values[f] for f in FACTOR_NAMES])
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "output": output_path,
+        "tile_size": args.tile_size,
+        "factors": factor_values,
+        "seconds": round(elapsed, 3),
+        "summary": summarize_tiles(tiles),
+        "tiles": tiles
+    }
+    with open(stats_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Scored {len(tiles)} tiles in {elapsed:.1f}s: risk raster {output_path}, tile statistics {stats_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+import numpy as np
+
+# torch and transformers are imported by the transformer backends themselves so
+# the lightweight hashing encoder works without them
+
+
+class TransformerEncoder:
+    """CLS-embedding text encoder around a Hugging Face transformer
+
+    With ``quantize=True`` the Linear layers are dynamically quantized to int8,
+    which is several times faster and smaller on CPU-only machines.
+    """
+
+    def __init__(self, model_name, quantize=False, max_length=128):
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+        self.model_name = model_name
+        self.name = f"{model_name}-int8" if quantize else model_name
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name)
+        self.dim = self.model.config.hidden_size
+        self.model.eval()
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def encode(self, texts, batch_size=16):
+        """Encode texts in length-sorted, dynamically padded mini-batches"""
+        import torch
+        encoded = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        # Sorting by token length keeps padding within each mini-batch small
+        order = sorted(range(len(texts)), key=lambda j: len(encoded["input_ids"][j]))
+        embeddings = [None] * len(texts)
+
+        with torch.no_grad():
+            for start in range(0, len(order), batch_size):
+                bucket = order[start:start + batch_size]
+                features = [{k: encoded[k][j] for k in encoded.keys()} for j in bucket]
+                tokens = self.tokenizer.pad(features, padding=True, return_tensors="pt")
+                output = self.model(**tokens)
+                cls = output.last_hidden_state[:, 0, :].numpy()
+                for j, emb in zip(bucket, cls):
+                    embeddings[j] = emb
+        return np.array(embeddings)
+
+    def size_bytes(self):
+        """Approximate in-memory size of the weights"""
+        import torch
+        state = self.model.state_dict()
+        total = 0
+        for value in state.values():
+            if isinstance(value, torch.Tensor):
+                total += value.element_size() * value.nelement()
+            elif isinstance(value, tuple):  # Packed quantized weights
+                total += sum(v.element_size() * v.nelement() for v in value if isinstance(v, torch.Tensor))
+        return total
+
+
+class HashingEncoder:
+    """Tiny deterministic bag-of-words encoder that needs no model download
+
+    Not meant for real predictions: it lets benchmarks and offline development
+    exercise the full scenario pipeline without torch or bert-base-uncased.
+    """
+
+    def __init__(self, dim=64):
+        self.name = f"hashing-{dim}"
+        self.dim = dim
+
+    def encode(self, texts, batch_size=16):
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in str(text).lower().split():
+                digest = hashlib.md5(word.encode("utf-8")).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                embeddings[i, bucket] += 1.0 if digest[4] & 1 else -1.0
+        return embeddings
+
+    def size_bytes(self):
+        return 0
+
+
+# Available encoder backends, selected with FLOODSENSE_ENCODER
+ENCODER_BACKENDS = {
+    "bert": lambda: TransformerEncoder("bert-base-uncased"),
+    "bert-int8": lambda: TransformerEncoder("bert-base-uncased", quantize=True),
+    "distilbert": lambda: TransformerEncoder("distilbert-base-uncased"),
+    "distilbert-int8": lambda: TransformerEncoder("distilbert-base-uncased", quantize=True),
+    "hashing": lambda: HashingEncoder()
+}
+
+DEFAULT_ENCODER = "bert"
+
+
+def create_encoder(backend=None):
+    """Build the configured encoder backend"""
+    backend = backend or os.environ.get("FLOODSENSE_ENCODER", DEFAULT_ENCODER)
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {sorted(ENCODER_BACKENDS)}")
+    return ENCODER_BACKENDS[backend]()
@@ -0,0 +1,212 @@
+"""Precomputed embedding index of known scenario descriptions
+
+Build the index offline from a corpus of curated or historic scenarios:
+
+    python scenario_index.py corpus.jsonl --output scenario_index --include-training
+
+The corpus is JSON lines, a JSON list or CSV with a ``text`` field, an
+optional ``id`` and optional factor scores, either as ``labels`` in
+FACTOR_LABELS order or as one field per factor name. Texts are encoded in
+batches straight into a memory-mapped float32 matrix, so the corpus never has
+to fit in memory as embeddings.
+"""
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+from embedding_cache import normalize_text
+from model_store import fingerprint
+
+# Factor order of the scenario model's labels and of the index's label matrix
+FACTOR_LABELS = ["Urbanization", "Deforestation", "ClimateChange", "DrainageSystems", "DamsQuality"]
+
+# Rows scored per matrix product, so a search over a large corpus stays small in memory
+SEARCH_BLOCK_ROWS = 16384
+
+
+def loose_key(text):
+    """Text reduced to lowercase words, so punctuation-only edits still match a known scenario"""
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+def is_missing(value):
+    """True for None and float NaN; lists and strings are never missing"""
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def read_corpus(path):
+    """Yield ``(id, text, labels)`` records; labels are a FACTOR_LABELS-ordered list or None"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        import pandas as pd
+        records = pd.read_csv(path).to_dict("records")
+    elif extension == ".json":
+        with open(path) as f:
+            records = json.load(f)
+    else:
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+
+    for i, record in enumerate(records):
+        # Blank CSV cells arrive as NaN, which counts as missing like an absent field
+        record = {key: value for key, value in record.items() if not is_missing(value)}
+        labels = record.get("labels")
+        if isinstance(labels, str):
+            labels = json.loads(labels)
+        if labels is None and all(f in record for f in FACTOR_LABELS):
+            labels = [record[f] for f in FACTOR_LABELS]
+        yield str(record.get("id", i)), str(record["text"]), [float(v) for v in labels] if labels else None
+
+
+def build_index(records, encoder, output, batch_size=64):
+    """Encode ``records`` batch by batch into an index directory and return its manifest"""
+    from numpy.lib.format import open_memmap
+    records = list(records)
+    os.makedirs(output, exist_ok=True)
+    start = time.perf_counter()
+
+    if not records:
+        raise ValueError("The scenario corpus is empty")
+
+    embeddings = None
+    labels = np.full((len(records), len(FACTOR_LABELS)), np.nan, dtype=np.float32)
+    for offset in range(0, len(records), batch_size):
+        batch = records[offset:offset + batch_size]
+        vectors = np.asarray(encoder.encode([text for _, text, _ in batch], batch_size=batch_size), dtype=np.float32)
+        if embeddings is None:
+            # The embedding size is only known once the first batch is encoded
+            embeddings = open_memmap(os.path.join(output, "embeddings.npy"), mode="w+", dtype=np.float32,
+                                     shape=(len(records), vectors.shape[1]))
+        # Rows are stored unit length so a dot product is the cosine similarity
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        embeddings[offset:offset + len(batch)] = vectors / np.where(norms > 0, norms, 1)
+        for j, (_, _, row_labels) in enumerate(batch):
+            if row_labels is not None:
+                labels[offset + j] = row_labels
+    embeddings.flush()
+    np.save(os.path.join(output, "labels.npy"), labels)
+
+    with open(os.path.join(output, "items.jsonl"), "w") as f:
+        for item_id, text, _ in records:
+            f.write(json.dumps({"id": item_id, "text": text}) + "\n")
+    manifest = {
+        "version": f"scenario_index-{fingerprint([r[1:] for r in records], encoder.name)[:12]}",
+        "encoder": encoder.name,
+        "count": len(records),
+        "dim": int(embeddings.shape[1]),
+        "labelled": int(np.isfinite(labels).all(axis=1).sum()),
+        "labels": FACTOR_LABELS,
+        "build_seconds": round(time.perf_counter() - start, 3)
+    }
+    with open(os.path.join(output, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+class ScenarioIndex:
+    """Memory-mapped scenario embeddings with exact top-k cosine search
+
+    Search is a blocked brute-force matrix product, which is exact and takes
+    milliseconds for corpora of thousands to tens of thousands of scenarios.
+    Exact and punctuation-insensitive text matches are found by hash lookups
+    without any embedding at all.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest["version"]
+        self.encoder_name = self.manifest["encoder"]
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self.labels = np.load(os.path.join(path, "labels.npy"))
+        self.labelled = np.isfinite(self.labels).all(axis=1)
+        with open(os.path.join(path, "items.jsonl")) as f:
+            self.items = [json.loads(line) for line in f]
+
+        # Earlier rows win when the corpus repeats a text
+        self._exact, self._loose = {}, {}
+        for row, item in enumerate(self.items):
+            self._exact.setdefault(normalize_text(item["text"]), row)
+            self._loose.setdefault(loose_key(item["text"]), row)
+
+    def __len__(self):
+        return len(self.items)
+
+    def match_text(self, text):
+        """``(row, "exact" | "near_duplicate")`` for a known text, or None"""
+        row = self._exact.get(normalize_text(text))
+        if row is not None:
+            return row, "exact"
+        row = self._loose.get(loose_key(text))
+        if row is not None:
+            return row, "near_duplicate"
+        return None
+
+    def factors(self, row):
+        """Labelled factor scores of a row by name, or None if it has none"""
+        if not self.labelled[row]:
+            return None
+        return {name: float(v) for name, v in zip(FACTOR_LABELS, self.labels[row])}
+
+    def search(self, queries, k=5):
+        """Top-k rows by cosine similarity for each query embedding: (rows, similarities), best first"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        k = min(k, len(self))
+        best_rows = np.empty((len(queries), 0), dtype=np.intp)
+        best_sims = np.empty((len(queries), 0), dtype=np.float32)
+
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = queries @ self.embeddings[start:start + SEARCH_BLOCK_ROWS].T
+            rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + block.shape[1]), block.shape)], axis=1)
+            sims = np.concatenate([best_sims, block], axis=1)
+            # Keep only the running top k of what has been seen so far
+            keep = np.argpartition(-sims, k - 1, axis=1)[:, :k] if sims.shape[1] > k else np.argsort(-sims, axis=1)
+            best_rows = np.take_along_axis(rows, keep, axis=1)
+            best_sims = np.take_along_axis(sims, keep, axis=1)
+
+        order = np.argsort(-best_sims, axis=1, kind="stable")
+        return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_sims, order, axis=1)
+
+    def neighbours(self, rows, similarities):
+        """JSON-ready description of search results for one query"""
+        return [{
+            "id": self.items[row]["id"],
+            "text": self.items[row]["text"],
+            "similarity": round(float(sim), 4),
+            "factors": self.factors(row)
+        } for row, sim in zip(rows, similarities)]
+
+
+def main():
+    import argparse
+    from scenario_encoders import create_encoder
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", help="scenario corpus (.jsonl, .json or .csv)")
+    parser.add_argument("--output", default="scenario_index", help="index directory to write")
+    parser.add_argument("--encoder", default=None, help="encoder backend (default FLOODSENSE_ENCODER or bert)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--include-training", action="store_true",
+                        help="also index the labelled scenarios the scenario model is trained on")
+    args = parser.parse_args()
+    if not args.corpus and not args.include_training:
+        parser.error("give a corpus file, --include-training, or both")
+
+    records = list(read_corpus(args.corpus)) if args.corpus else []
+    if args.include_training:
+        from flood_scenario_model import SCENARIO_TRAINING_DATA
+        records += [(f"training-{i}", d["text"], [float(v) for v in d["labels"]])
+                    for i, d in enumerate(SCENARIO_TRAINING_DATA)]
+
+    manifest = build_index(records, create_encoder(args.encoder), args.output, args.batch_size)
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
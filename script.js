@@ -88,6 +88,11 @@ document.addEventListener('DOMContentLoaded', function() {
     // API endpoint (change this to your actual server URL)
     const API_URL = 'http://localhost:5000';
     
+    // Trained risk model downloaded from the server and scored in the browser
+    const EXPORTED_MODEL_FORMAT = 'floodsense-tree-ensemble';
+    const EXPORTED_MODEL_FORMAT_VERSION = 1;
+    let exportedRiskModel = null;
+    
     // Modern Chart.js theme
     Chart.defaults.color = '#a0b0c5';
     Chart.defaults.borderColor = 'rgba(42, 55, 82, 0.5)';
@@ -137,6 +142,7 @@ document.addEventListener('DOMContentLoaded', function() {
         initNavigation();
         initLocationSearch();
         initCollapsibleSections();
+        loadExportedRiskModel();
         
         // Set default values for form inputs
         document.getElementById('rainfall').value = '50';
@@ -252,7 +258,20 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         // Make prediction based on selected model
-        if (selectedModel === 'simplified') {
+        if (selectedModel === 'local' && exportedRiskModel) {
+            // Scored in the browser with the server's trained model, no round trip
+            const prediction = predictFloodRiskLocal(rainfall, waterLevel, humidity, temperature);
+            currentPrediction = prediction;
+            
+            displayPredictionResult(prediction);
+            updateMap(prediction, currentInputData);
+            updateGaugeChart(prediction);
+            updateFactorsChart(rainfall, waterLevel, humidity, temperature, prediction);
+            updateHistoryChart(rainfall, waterLevel, humidity, temperature, prediction);
+        } else if (selectedModel === 'simplified' || selectedModel === 'local') {
+            if (selectedModel === 'local') {
+                showError('The trained model has not been downloaded. Using simplified model instead.');
+            }
             // Use client-side prediction
             const prediction = predictFloodRiskSimplified(rainfall, waterLevel, humidity, temperature);
             
@@ -345,26 +364,14 @@ document.addEventListener('DOMContentLoaded', function() {
             </div>
         `;
         
-        // Call the simulation API
-        fetch(`${API_URL}/api/simulate`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                rainfall: rainfall,
-                waterLevel: waterLevel,
-                humidity: humidity,
-                temperature: temperature,
-                scenario: scenarioText,
-                years: years
-            })
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error('Network response was not ok');
-            }
-            return response.json();
+        // Call the streaming simulation API so the chart starts drawing immediately
+        streamSimulation({
+            rainfall: rainfall,
+            waterLevel: waterLevel,
+            humidity: humidity,
+            temperature: temperature,
+            scenario: scenarioText,
+            years: years
         })
         .then(data => {
             // Display simulation results
@@ -383,6 +390,78 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
     
+    // Function to run a simulation through the NDJSON streaming endpoint,
+    // drawing each chunk of years as it arrives
+    function streamSimulation(requestBody) {
+        return fetch(`${API_URL}/api/simulate/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify(requestBody)
+        })
+        .then(response => {
+            if (!response.ok || !response.body) {
+                throw new Error('Network response was not ok');
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            const data = { risks: [], years: [], features: {}, feature_trajectories: {}, narrative: '' };
+            let buffer = '';
+            
+            function handleMessage(message) {
+                if (message.type === 'start') {
+                    data.features = message.features;
+                    if (message.scenario_factors) {
+                        data.scenario_factors = message.scenario_factors;
+                    }
+                    for (const [factor, value] of Object.entries(message.initial_factors)) {
+                        data.feature_trajectories[factor] = [value];
+                    }
+                } else if (message.type === 'chunk') {
+                    data.years.push(...message.years);
+                    data.risks.push(...message.risks);
+                    for (const [factor, values] of Object.entries(message.feature_trajectories)) {
+                        data.feature_trajectories[factor].push(...values);
+                    }
+                    
+                    if (data.years.length === message.years.length) {
+                        // First chunk: create the chart and show the tab
+                        updateSimulationChart({ years: data.years.slice(), risks: data.risks.slice() });
+                        activateTab('simulation');
+                    } else if (simulationChart) {
+                        simulationChart.data.labels.push(...message.years.map(year => `Year ${year}`));
+                        simulationChart.data.datasets[0].data.push(...message.risks);
+                        simulationChart.update('none');
+                    }
+                } else if (message.type === 'end') {
+                    data.narrative = message.narrative;
+                    data.feature_importance = message.feature_importance;
+                }
+            }
+            
+            function pump() {
+                return reader.read().then(({ done, value }) => {
+                    buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => handleMessage(JSON.parse(line)));
+                    
+                    if (done) {
+                        if (data.risks.length === 0) {
+                            throw new Error('Empty simulation stream');
+                        }
+                        return data;
+                    }
+                    return pump();
+                });
+            }
+            
+            return pump();
+        });
+    }
+    
     // Function to initialize years slider
     function initYearsSlider() {
         simulationYears.addEventListener('input', function() {
@@ -573,6 +652,85 @@ document.addEventListener('DOMContentLoaded', function() {
         return riskLevel;
     }
     
+    // Function to download the server's trained risk model for in-browser scoring
+    function loadExportedRiskModel() {
+        return fetch(`${API_URL}/api/model/export`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('No exported model available');
+                }
+                return response.json();
+            })
+            .then(model => {
+                if (model.format !== EXPORTED_MODEL_FORMAT || model.formatVersion !== EXPORTED_MODEL_FORMAT_VERSION) {
+                    throw new Error(`Unsupported model format ${model.format} v${model.formatVersion}`);
+                }
+                exportedRiskModel = model;
+                console.log(`Loaded risk model ${model.modelVersion} (${model.roots.length} trees)`);
+                return model;
+            })
+            .catch(error => {
+                console.warn('Trained model unavailable in the browser:', error.message);
+                return null;
+            });
+    }
+    
+    // Function to score one input row with an exported tree ensemble. Inputs are
+    // rounded to float32 as scikit-learn does and the trees are added in order,
+    // so the result is identical to the server's prediction
+    function evaluateTreeEnsemble(model, features) {
+        const x = features.map(Math.fround);
+        let total = model.init;
+        for (let t = 0; t < model.roots.length; t++) {
+            let node = model.roots[t];
+            // Leaves point back at themselves
+            while (model.left[node] !== node) {
+                node = x[model.feature[node]] <= model.threshold[node] ? model.left[node] : model.right[node];
+            }
+            total += model.learningRate * model.value[node];
+        }
+        return total;
+    }
+    
+    // Function to compute the 0-10 risk the server's simulation assigns to raw inputs
+    function scoreRiskLocal(model, features) {
+        let x = features;
+        if (model.scaler) {
+            // Simulation states are stored scaled, so repeat the server's scale/unscale round trip
+            const { mean, scale } = model.scaler;
+            x = features.map((v, i) => ((v - mean[i]) / scale[i]) * scale[i] + mean[i]);
+        }
+        return Math.min(Math.max(evaluateTreeEnsemble(model, x), 0), 10);
+    }
+    
+    // Function to predict flood risk in the browser with the downloaded trained model
+    function predictFloodRiskLocal(rainfall, waterLevel, humidity, temperature) {
+        const probability = scoreRiskLocal(exportedRiskModel, [rainfall, waterLevel, humidity, temperature]) * 10;
+        const baseResult = predictFloodRiskSimplified(rainfall, waterLevel, humidity, temperature);
+        
+        let level, message;
+        if (probability >= 70) {
+            level = 'high';
+            message = 'Trained Model: High flood risk detected! Consider evacuation or emergency preparations.';
+        } else if (probability >= 40) {
+            level = 'medium';
+            message = 'Trained Model: Medium flood risk detected. Monitor conditions closely.';
+        } else {
+            level = 'low';
+            message = 'Trained Model: Low flood risk. Normal precautions advised.';
+        }
+        
+        return {
+            level: level,
+            message: message,
+            probability: probability,
+            factorScores: baseResult.factorScores,
+            totalScore: probability,
+            isMLPrediction: true,
+            modelVersion: exportedRiskModel.modelVersion
+        };
+    }
+    
     // Client-side simulation when server is not available
     function simulateClientSide(rainfall, waterLevel, humidity, temperature, scenarioText, years) {
         // Parse scenario for keywords
@@ -665,6 +823,11 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Helper function for client-side simulation
     function calculateBaseRisk(rainfall, waterLevel, humidity, temperature) {
+        // Prefer the trained model when it has been downloaded
+        if (exportedRiskModel) {
+            return scoreRiskLocal(exportedRiskModel, [rainfall, waterLevel, humidity, temperature]);
+        }
+        
         // Normalize to 0-1 scale
         const normRainfall = Math.min(rainfall / 200, 1);
         const normWaterLevel = Math.min(waterLevel / 10, 1);
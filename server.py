@@ -1,89 +1,237 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 import numpy as np
-import pandas as pd
-import tensorflow as tf
-from sklearn.preprocessing import StandardScaler
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.model_selection import train_test_split
+import hmac
 import json
+import multiprocessing
 import os
-# Import the flood scenario model
-from flood_scenario_model import FloodScenarioModel
+import shutil
+import tempfile
+import threading
+import time
+import flood_simulation
+import metrics
+from flood_simulation import ENV_NAMES, FACTOR_NAMES, N_ENV
+from model_loader import LazyModel
+from model_store import ArtifactStore, fingerprint
+from model_registry import ModelRegistry
+from data_ingest import (DEFAULT_CHUNK_ROWS, FEATURE_COLUMNS, LABEL_COLUMN, TARGET_COLUMN,
+                         iter_frames, iter_training_chunks, load_training_frame, parse_label_means)
+from inference_batcher import MicroBatcher, QueueFullError
+from response_cache import ResponseCache, cache_key, quantize
+from embedding_cache import text_key
+from tree_inference import CompiledTreeEnsemble, export_model, verify_against_sklearn
+from interpolation_table import GridTable
+from attribution import sampled_shapley, one_at_a_time
+from scenario_index import ScenarioIndex
+
+# pandas, scikit-learn, TensorFlow and the BERT scenario model are imported
+# inside the loaders below so the server starts in well under a second and
+# each model is only built by the first request that needs it
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=["X-Model-Version", "X-Cache"])  # Enable CORS for all routes
 
-# Load the training dataset
 training_data_path = 'Generated_Flood_Risk_Training_Dataset.csv'
-if os.path.exists(training_data_path):
-    try:
-        flood_training_data = pd.read_csv(training_data_path)
-        print(f"Training dataset loaded successfully with {len(flood_training_data)} records")
-    except Exception as e:
-        flood_training_data = None
-        print(f"Error loading training dataset: {e}")
-else:
-    flood_training_data = None
-    print(f"Training dataset not found at {training_data_path}")
-
-# Create and train a risk prediction model based on the dataset
-flood_risk_model = None
-if flood_training_data is not None:
-    try:
-        # Extract features and target from the dataset
-        X_train = flood_training_data[['Rainfall (mm)', 'Water Level (m)', 'Humidity (%)', 'Temperature (°C)']].values
-        
-        # Parse the labels correctly - they're in string format like "[1, 2, 3, 4, 5]"
-        y_train = flood_training_data['labels'].apply(lambda x: sum(eval(x))/len(eval(x))).values
-        
-        # Train a model
-        flood_risk_model = GradientBoostingRegressor(
-            n_estimators=100, 
-            learning_rate=0.1, 
-            max_depth=4,
-            random_state=42
-        )
-        flood_risk_model.fit(X_train, y_train)
-        print("Flood risk prediction model trained successfully")
-        
-        # Print feature importances
-        feature_names = ['Rainfall', 'Water Level', 'Humidity', 'Temperature']
-        importances = flood_risk_model.feature_importances_
-        for i, importance in enumerate(importances):
-            print(f"Feature {feature_names[i]}: {importance:.4f}")
-            
-    except Exception as e:
-        print(f"Error training flood risk model: {e}")
-        import traceback
-        traceback.print_exc()
 
-# Load the neural network model if it exists
-model = None
-if os.path.exists('floodnet_model.h5'):
-    try:
-        model = tf.keras.models.load_model('floodnet_model.h5')
-        print("Neural network model loaded successfully")
-    except Exception as e:
-        print(f"Error loading neural network model: {e}")
 
-# Initialize the scenario model
-try:
-    scenario_model = FloodScenarioModel()
+# How the risk model training data is read and fitted; part of the artifact fingerprint.
+# "full" fits on every row (or a uniform sample of FLOODSENSE_TRAINING_MAX_ROWS);
+# "incremental" streams the file and boosts a few trees per chunk, so memory
+# stays bounded by one chunk however large the dataset grows
+TRAINING_CONFIG = dict(
+    mode=os.environ.get("FLOODSENSE_TRAINING_MODE", "full"),
+    chunk_rows=int(os.environ.get("FLOODSENSE_TRAINING_CHUNK_ROWS", DEFAULT_CHUNK_ROWS)),
+    max_rows=int(os.environ["FLOODSENSE_TRAINING_MAX_ROWS"]) if os.environ.get("FLOODSENSE_TRAINING_MAX_ROWS") else None,
+    stages_per_chunk=int(os.environ.get("FLOODSENSE_TRAINING_STAGES_PER_CHUNK", 10))
+)
+
+
+model_registry = ModelRegistry()
+
+
+def risk_data_path():
+    """Training data of the active risk model: a registry snapshot after retraining, else the bundled CSV"""
+    entry = model_registry.active("flood_risk_model")
+    return entry["data"] if entry and entry.get("data") else training_data_path
+
+
+def load_training_data(path=None):
+    """Load the training dataset"""
+    path = path or risk_data_path()
+    if not os.path.exists(path):
+        print(f"Training dataset not found at {path}")
+        return None
+    if TRAINING_CONFIG["mode"] == "incremental":
+        # Incremental training and the baselines stream the file themselves
+        print("Training dataset is streamed per chunk in incremental mode, not loaded")
+        return None
+    # Read in chunks, keeping only the feature columns and the parsed label means
+    flood_training_data = load_training_frame(path, TRAINING_CONFIG["chunk_rows"], TRAINING_CONFIG["max_rows"])
+    print(f"Training dataset loaded successfully with {len(flood_training_data)} records")
+    return flood_training_data
+
+
+# Hyperparameters of the risk model; part of the artifact fingerprint
+RISK_MODEL_PARAMS = dict(
+    n_estimators=100, 
+    learning_rate=0.1, 
+    max_depth=4,
+    random_state=42
+)
+
+artifact_store = ArtifactStore()
+
+
+def train_risk_artifacts(path=None, flood_training_data=None):
+    """Create and train a risk prediction model and feature scaler based on the dataset"""
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.preprocessing import StandardScaler
+    if TRAINING_CONFIG["mode"] == "incremental":
+        return train_risk_artifacts_incremental(path)
+    if flood_training_data is None:
+        flood_training_data = training_data.get() if path is None else load_training_data(path)
+    
+    # Extract features and target (the mean of each row's label list) from the dataset
+    X_train = flood_training_data[FEATURE_COLUMNS].values
+    y_train = flood_training_data[TARGET_COLUMN].values
+    
+    # Train a model
+    flood_risk_model = GradientBoostingRegressor(**RISK_MODEL_PARAMS)
+    flood_risk_model.fit(X_train, y_train)
+    print("Flood risk prediction model trained successfully")
+    
+    # Print feature importances
+    feature_names = ['Rainfall', 'Water Level', 'Humidity', 'Temperature']
+    importances = flood_risk_model.feature_importances_
+    for i, importance in enumerate(importances):
+        print(f"Feature {feature_names[i]}: {importance:.4f}")
+    
+    # The scaler is fitted on the same rows so the pair is always consistent
+    return {
+        "flood_risk_model": flood_risk_model,
+        "feature_scaler": StandardScaler().fit(X_train)
+    }
+
+
+def train_risk_artifacts_incremental(path=None):
+    """Out-of-core training: each chunk of the file boosts the next few trees"""
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.preprocessing import StandardScaler
+    path = path or risk_data_path()
+    chunk_rows, stages_per_chunk = TRAINING_CONFIG["chunk_rows"], TRAINING_CONFIG["stages_per_chunk"]
+    
+    # The scaler only needs running moments, so one pass fits it exactly
+    feature_scaler = StandardScaler()
+    for X, _ in iter_training_chunks(path, chunk_rows):
+        if len(X):
+            feature_scaler.partial_fit(X)
+    
+    # warm_start keeps the fitted trees, so each fit adds stages on a new chunk.
+    # The file is read again from the start if it runs out before all stages are fitted
+    flood_risk_model = GradientBoostingRegressor(**RISK_MODEL_PARAMS, warm_start=True)
+    n_estimators = RISK_MODEL_PARAMS["n_estimators"]
+    fitted = 0
+    while fitted < n_estimators:
+        for X, y in iter_training_chunks(path, chunk_rows):
+            # A chunk whose rows were all dropped as invalid has nothing to fit
+            if not len(y):
+                continue
+            fitted = min(n_estimators, fitted + stages_per_chunk)
+            flood_risk_model.set_params(n_estimators=fitted)
+            flood_risk_model.fit(X, y)
+            if fitted == n_estimators:
+                break
+        else:
+            if fitted == 0:
+                raise ValueError(f"No usable training rows in {path}")
+    print(f"Flood risk prediction model trained incrementally in chunks of {chunk_rows} rows")
+    
+    return {
+        "flood_risk_model": flood_risk_model,
+        "feature_scaler": feature_scaler
+    }
+
+
+def effective_training_config():
+    """The TRAINING_CONFIG settings that change the fitted model in the current mode
+
+    Full training reads the same rows (and sample) whatever the chunk size,
+    while incremental training ignores max_rows but boosts per chunk.
+    """
+    if TRAINING_CONFIG["mode"] == "incremental":
+        return {k: TRAINING_CONFIG[k] for k in ("mode", "chunk_rows", "stages_per_chunk")}
+    return {k: TRAINING_CONFIG[k] for k in ("mode", "max_rows")}
+
+
+def load_risk_artifacts(path=None, flood_training_data=None):
+    """Load the risk model bundle for the current dataset, training only if it changed"""
+    import sklearn
+    explicit = path is not None
+    path = path or risk_data_path()
+    if not os.path.exists(path):
+        print(f"Training dataset not found at {path}")
+        return None
+    training = effective_training_config()
+    key = fingerprint(path, RISK_MODEL_PARAMS, training, sklearn.__version__)
+    bundle = artifact_store.load_or_build(
+        "flood_risk_model", key,
+        lambda: train_risk_artifacts(path if explicit else None, flood_training_data),
+        metadata={"params": RISK_MODEL_PARAMS, "training": training, "data": path})
+    return dict(bundle, version=artifact_store.version("flood_risk_model", key), data=path)
+
+
+NN_MODEL_PATH = 'floodnet_model.h5'
+
+
+def load_nn_model():
+    """Load the neural network model if it exists"""
+    if not os.path.exists(NN_MODEL_PATH):
+        return None
+    import tensorflow as tf
+    nn_model = tf.keras.models.load_model(NN_MODEL_PATH)
+    print("Neural network model loaded successfully")
+    return nn_model
+
+
+def load_scenario_model(path=None):
+    """Initialize the BERT-based scenario model"""
+    from flood_scenario_model import FloodScenarioModel
+    if path is None:
+        entry = model_registry.active("scenario_model")
+        path = entry.get("data") if entry else None
+    scenarios = None
+    if path:
+        with open(path) as f:
+            scenarios = json.load(f)
+    model = FloodScenarioModel(training_data=scenarios, index=scenario_index.get())
     print("Scenario model loaded successfully")
-except Exception as e:
-    scenario_model = None
-    print(f"Error loading scenario model: {e}")
+    return model
+
+
+def load_compiled_risk_model(artifacts=None):
+    """The risk model exported to flat arrays, falling back to sklearn if it cannot be compiled"""
+    if artifacts is None:
+        artifacts = risk_artifacts.get()
+    model = (artifacts or {}).get("flood_risk_model")
+    if model is None:
+        return None
+    try:
+        # Spot-check the export on inputs spanning the training range before trusting it
+        sample = np.random.default_rng(0).uniform([0, 0, 20, -5], [200, 10, 100, 40], size=(256, 4))
+        return verify_against_sklearn(model, sample)
+    except (ValueError, AssertionError) as e:
+        print(f"Using the sklearn risk model, compiling it failed: {e}")
+        return model
+
 
 # Create a proper scaler for standardizing inputs
 # This will be used for both prediction and simulation
 class FeatureScaler:
-    def __init__(self):
-        self.scaler = StandardScaler()
-        # Train the scaler if we have training data
-        if flood_training_data is not None:
-            X = flood_training_data[['Rainfall (mm)', 'Water Level (m)', 'Humidity (%)', 'Temperature (°C)']].values
-            self.scaler.fit(X)
+    def __init__(self, scaler=None):
+        from sklearn.preprocessing import StandardScaler
+        # Use the StandardScaler fitted alongside the risk model if we have one
+        self.scaler = scaler if scaler is not None else StandardScaler()
     
     def transform(self, X):
         # If we don't have a trained scaler, do simple normalization
@@ -99,45 +247,181 @@ class FeatureScaler:
         else:
             return X * np.array([200.0, 10.0, 100.0, 40.0])
 
-scaler = FeatureScaler()
-
-# Create dataset for simulation with typical values
-columns = ["Rainfall", "WaterLevel", "Humidity", "Temperature", 
-           "ClimateChange", "Urbanization", "Deforestation", 
-           "DrainageSystems", "DamsQuality"]
-
-# Use training data to initialize if available, otherwise use defaults
-if flood_training_data is not None:
-    X = pd.DataFrame({
-        "Rainfall": flood_training_data['Rainfall (mm)'],
-        "WaterLevel": flood_training_data['Water Level (m)'], 
-        "Humidity": flood_training_data['Humidity (%)'],
-        "Temperature": flood_training_data['Temperature (°C)'],
-        "ClimateChange": [5.0] * len(flood_training_data),
-        "Urbanization": [5.0] * len(flood_training_data),
-        "Deforestation": [5.0] * len(flood_training_data),
-        "DrainageSystems": [5.0] * len(flood_training_data),
-        "DamsQuality": [5.0] * len(flood_training_data)
-    })
-else:
-    X = pd.DataFrame(np.random.rand(100, len(columns)) * 10, columns=columns)
 
+def stream_feature_means(path):
+    """Column means of the training features from one chunked pass over ``path``"""
+    total, count = np.zeros(len(FEATURE_COLUMNS)), 0
+    for X, _ in iter_training_chunks(path, TRAINING_CONFIG["chunk_rows"]):
+        total += X.sum(axis=0)
+        count += len(X)
+    return total / count if count else None
 
-def generate_sequences(data, seq_length):
-    """Generate sequences for LSTM input"""
-    # This is a simplified function - in real implementation, this would handle time sequences
-    return np.array([data[0]] * seq_length).reshape(1, seq_length, -1)
 
+def build_baseline_features(flood_training_data=None, path=None):
+    """Create dataset for simulation with typical values"""
+    import pandas as pd
+    columns = ["Rainfall", "WaterLevel", "Humidity", "Temperature", 
+               "ClimateChange", "Urbanization", "Deforestation", 
+               "DrainageSystems", "DamsQuality"]
+    
+    # Use training data to initialize if available, otherwise use defaults
+    if flood_training_data is None and TRAINING_CONFIG["mode"] == "incremental":
+        # Callers only read column means, so keep a single row of them rather than the file
+        path = path or risk_data_path()
+        means = stream_feature_means(path) if os.path.exists(path) else None
+        if means is not None:
+            return pd.DataFrame([list(means) + [5.0] * (len(columns) - len(means))], columns=columns)
+    elif flood_training_data is None:
+        flood_training_data = training_data.get()
+    if flood_training_data is not None:
+        return pd.DataFrame({
+            "Rainfall": flood_training_data['Rainfall (mm)'],
+            "WaterLevel": flood_training_data['Water Level (m)'], 
+            "Humidity": flood_training_data['Humidity (%)'],
+            "Temperature": flood_training_data['Temperature (°C)'],
+            "ClimateChange": [5.0] * len(flood_training_data),
+            "Urbanization": [5.0] * len(flood_training_data),
+            "Deforestation": [5.0] * len(flood_training_data),
+            "DrainageSystems": [5.0] * len(flood_training_data),
+            "DamsQuality": [5.0] * len(flood_training_data)
+        })
+    return pd.DataFrame(np.random.rand(100, len(columns)) * 10, columns=columns)
 
-def simulate_and_narrate(features, years=20):
-    """Simulate flood risk over time and provide narrative"""
-    # Improved drift factors based on scientific climate projections
-    # Different factors have different rates of change and interdependencies
-    base_drift = np.array([0.03, 0.04, 0.015, 0.02, 0.01])  # Climate, Urban, Deforest, Drainage, Dams
+
+# Every model is built on first use; /healthz and /readyz report their state
+training_data = LazyModel("training_data", load_training_data)
+risk_artifacts = LazyModel("risk_artifacts", load_risk_artifacts)
+flood_risk_model = LazyModel("flood_risk_model", load_compiled_risk_model)
+scaler = LazyModel("scaler", lambda: FeatureScaler((risk_artifacts.get() or {}).get("feature_scaler")))
+baseline_features = LazyModel("baseline_features", build_baseline_features)
+nn_model = LazyModel("nn_model", load_nn_model)
+scenario_model = LazyModel("scenario_model", load_scenario_model)
+
+lazy_models = [training_data, risk_artifacts, flood_risk_model, scaler, baseline_features, nn_model, scenario_model]
+
+
+# Inputs of /api/predict in request order, with the ranges the interpolation table covers
+PREDICT_INPUTS = ["rainfall", "waterLevel", "humidity", "temperature"]
+PREDICT_LOWS = [0.0, 0.0, 0.0, -10.0]
+PREDICT_HIGHS = [200.0, 10.0, 100.0, 40.0]
+PREDICT_FORMULA_WEIGHTS = np.array([0.4, 0.3, 0.2, 0.1])
+
+
+def normalize_predict_inputs(X):
+    """Vectorized form of the /api/predict input normalization"""
+    X = np.asarray(X, dtype=float)
+    return np.column_stack([
+        np.minimum(X[:, 0] / 200.0, 1.0),
+        np.minimum(X[:, 1] / 10.0, 1.0),
+        X[:, 2] / 100.0,
+        (X[:, 3] + 10) / 50.0
+    ])
+
+
+def predict_surface(X, model=None):
+    """Deterministic /api/predict risk score (0-100) for many raw inputs at once"""
+    normalized = normalize_predict_inputs(X)
+    if model is None:
+        return normalized @ PREDICT_FORMULA_WEIGHTS * 100
+    return np.asarray(model.predict(normalized), dtype=float).reshape(-1) * 100
+
+
+def load_predict_table():
+    """Tabulate the /api/predict risk surface when FLOODSENSE_PREDICT_TABLE=1"""
+    if os.environ.get("FLOODSENSE_PREDICT_TABLE", "0") != "1":
+        return None
+    points = [int(n) for n in os.environ.get("FLOODSENSE_PREDICT_GRID", "21,21,21,21").split(",")]
+    # Wait for the network so the table describes the model /api/predict would use
+    model = nn_model.get()
+    source = NN_MODEL_PATH if model is not None else "formula"
+    key = fingerprint(source, points, PREDICT_LOWS, PREDICT_HIGHS)
+
+    def build():
+        table = GridTable.build(lambda X: predict_surface(X, model), PREDICT_LOWS, PREDICT_HIGHS, points)
+        max_error = table.measure_error(lambda X: predict_surface(X, model))
+        print(f"Predict table {points} built from {source}, max interpolation error {max_error:.4f}")
+        return {"values": table.values, "max_error": max_error, "source": source}
+
+    bundle = artifact_store.load_or_build("predict_table", key, build,
+                                          metadata={"source": source, "points": points})
+    return GridTable(PREDICT_LOWS, PREDICT_HIGHS, bundle["values"], bundle["max_error"]), bundle["source"]
+
+
+predict_table = LazyModel("predict_table", load_predict_table)
+if os.environ.get("FLOODSENSE_PREDICT_TABLE", "0") == "1":
+    lazy_models.append(predict_table)
+
+
+def load_scenario_index():
+    """Open the scenario index built by scenario_index.py, if FLOODSENSE_SCENARIO_INDEX names one"""
+    path = os.environ.get("FLOODSENSE_SCENARIO_INDEX")
+    if not path:
+        return None
+    index = ScenarioIndex(path)
+    print(f"Scenario index {index.version} loaded with {len(index)} scenarios")
+    return index
+
+
+scenario_index = LazyModel("scenario_index", load_scenario_index)
+if os.environ.get("FLOODSENSE_SCENARIO_INDEX"):
+    lazy_models.append(scenario_index)
+
+
+def create_scenario_batcher():
+    """Micro-batch concurrent scenario texts into one encoder and regressor pass"""
+    model = scenario_model.get()
+    if model is None:
+        return None
+    
+    def predict_batch(texts):
+        # Runs on the batcher thread, so label its stages separately from the requests
+        metrics.current_endpoint.set("scenario_batcher")
+        # Looked up per batch so a hot-swapped model is used straight away
+        return scenario_model.get().predict_batch(texts)
     
-    # Get indices for all factors that can change over time
-    factor_names = ["ClimateChange", "Urbanization", "Deforestation", "DrainageSystems", "DamsQuality"]
-    indices = [X.columns.get_loc(f) for f in factor_names]
+    return MicroBatcher(
+        predict_batch,
+        max_batch_size=int(os.environ.get("FLOODSENSE_BATCH_MAX_SIZE", 16)),
+        max_wait_ms=float(os.environ.get("FLOODSENSE_BATCH_MAX_WAIT_MS", 5)),
+        max_queue=int(os.environ.get("FLOODSENSE_BATCH_QUEUE_DEPTH", 256)),
+        name="scenario-batcher"
+    )
+
+
+scenario_batcher = LazyModel("scenario_batcher", create_scenario_batcher)
+
+
+# Process that last started the ensemble pool; /readyz calls warm-up repeatedly
+ensemble_pool_warmed = None
+
+
+def ensemble_jobs():
+    """Processes for ensemble chunks from FLOODSENSE_ENSEMBLE_JOBS, None for every core"""
+    return int(os.environ.get("FLOODSENSE_ENSEMBLE_JOBS", 1)) or None
+
+
+def warm_up_models():
+    """Load every model in background threads"""
+    for lazy_model in lazy_models:
+        lazy_model.warm_up()
+    warm_up_ensemble_pool()
+
+
+def warm_up_ensemble_pool():
+    """Spawn the ensemble pool workers ahead of the first request that needs them"""
+    global ensemble_pool_warmed
+    n_jobs = ensemble_jobs()
+    if n_jobs != 1 and ensemble_pool_warmed != os.getpid():
+        ensemble_pool_warmed = os.getpid()
+        # Workers unpickle FeatureScaler and its StandardScaler, so import both up front
+        flood_simulation.warm_up_pool(n_jobs, modules=[__name__, "sklearn.preprocessing"])
+        print(f"Ensemble pool started with {n_jobs or os.cpu_count()} workers")
+
+
+def build_initial_state(features):
+    """Build the scaled 9-element simulation state for a dict of input features"""
+    import pandas as pd
+    X = baseline_features.get()
     
     # Create base feature set
     base = pd.DataFrame([X.mean()], columns=X.columns)
@@ -145,133 +429,58 @@ def simulate_and_narrate(features, years=20):
         base[k] = features[k]
     
     # Initialize with scaled features
-    x0 = scaler.transform(base[["Rainfall", "WaterLevel", "Humidity", "Temperature"]].values).flatten()
+    x0 = scaler.get().transform(base[ENV_NAMES].values).flatten()
     
     # Add the climate factors
-    x0 = np.concatenate([x0, [base[factor].values[0] / 10.0 for factor in factor_names]])
-    
-    # Simulate over years
-    risks = []
-    feature_trajectories = {factor: [] for factor in factor_names}
+    return np.concatenate([x0, [base[factor].values[0] / 10.0 for factor in FACTOR_NAMES]])
+
+
+def simulate_and_narrate(features, years=20):
+    """Simulate flood risk over time and provide narrative"""
+    with metrics.stage("initial_state"):
+        x0 = build_initial_state(features)
+        feature_scaler, risk_model, network = scaler.get(), flood_risk_model.get(), nn_model.get()
     
-    # Store initial values
-    for i, factor in enumerate(factor_names):
-        feature_trajectories[factor].append(base[factor].values[0])
+    # Step the state forward, then score every year in one batched model call
+    with metrics.stage("year_loop"):
+        states = flood_simulation.simulate_states(x0, years)
+    with metrics.stage("risk_model"):
+        risk_matrix = flood_simulation.score_states(states, years, feature_scaler, risk_model, network,
+                                                    history=np.atleast_2d(x0))
+    risks = [float(r) for r in risk_matrix[:, 0]]
     
-    for t in range(years):
-        xt = x0.copy()
-        
-        # First handle base drift for climate factors
-        for i, idx in enumerate(indices):
-            # The indices need to be offset by 4 (number of environmental factors)
-            idx_adjusted = idx
-            if idx_adjusted >= 4:
-                # Adjust for the fact that we're using a flattened feature vector
-                idx_adjusted = i + 4
-                
-            # Base drift modified by current value of the factor (logistic-like growth)
-            current_val = xt[idx_adjusted]
-            # Calculate drift based on current value - nonlinear effects
-            drift_modifier = 1.0
-            
-            # Climate change accelerates over time (reinforcing loop)
-            if i == 0 and t > 10:  # ClimateChange factor after 10 years
-                drift_modifier = 1.2  # Accelerating climate effects
-            
-            # Urban growth slows as it approaches capacity
-            if i == 1 and current_val > 0.7:  # Urbanization factor approaching limits
-                drift_modifier = 0.7  # Slowing urban growth at high levels
-            
-            # Calculate effective drift
-            effective_drift = base_drift[i] * drift_modifier
-            
-            # Apply drift with constraints
-            if factor_names[i] in ["DrainageSystems", "DamsQuality"]:
-                # Infrastructure degrades over time unless maintained
-                xt[idx_adjusted] = max(0, xt[idx_adjusted] - (effective_drift * 0.5))
-            else:
-                xt[idx_adjusted] = min(1.0, xt[idx_adjusted] + effective_drift)
-        
-        # Now handle interactions between factors
-        
-        # Deforestation makes climate change worse
-        if xt[6] > 0.6:  # High deforestation
-            xt[4] = min(1.0, xt[4] + 0.01)  # Increases climate change
-            
-        # Good drainage systems reduce impact of urbanization
-        if xt[7] > 0.7:  # Good drainage systems
-            urban_impact = max(0, xt[5] - 0.2)  # Reduce effective urbanization
-        else:
-            urban_impact = xt[5] * 1.2  # Amplify urbanization effects with poor drainage
-            
-        # Dam quality affects water level management
-        dam_effectiveness = xt[8]
-        
-        # Prepare environmental features for prediction model
-        env_features = xt[:4].reshape(1, -1)
-        # Inverse transform to get original scale for the trained model
-        env_features_orig = scaler.inverse_transform(env_features)
-        
-        # Use the dataset-trained model or neural network model or simplified approach
-        if flood_risk_model is not None:
-            # Use our trained model from the dataset
-            risk = float(flood_risk_model.predict(env_features_orig).flatten()[0])
-            # Scale to 0-10 range
-            risk = min(max(risk, 0), 10)
-        elif model is not None:
-            # Use neural network model
-            x_cnn = xt.reshape(1, 3, 3, 1)  # Reshape for CNN input
-            x_lstm = generate_sequences([xt], 5)  # Generate sequences for LSTM
-            risk = float(model.predict([x_cnn, x_lstm]).flatten()[0]) * 10
-        else:
-            # Enhanced calculation considering interactions and nonlinear effects
-            
-            # Calculate base environmental risk
-            rain_impact = xt[0] * 0.4  # Rainfall
-            water_impact = xt[1] * 0.3  # Water level
-            
-            # Water level is affected by dam quality
-            water_impact = water_impact * (1.0 - (dam_effectiveness * 0.5))
-            
-            # Humidity impact increases with temperature
-            humidity_temp_interaction = xt[2] * xt[3] * 0.3  # Humidity and Temperature interact
-            
-            # Environmental base risk
-            env_risk = rain_impact + water_impact + humidity_temp_interaction
-            
-            # Climate factors with interactions
-            climate_impact = (xt[4] * 0.5 +   # Climate change
-                             urban_impact * 0.3 +     # Urbanization (modified by drainage)
-                             xt[6] * 0.2)    # Deforestation
-            
-            # Final risk calculation with nonlinear scaling
-            # Higher weights for environmental factors in early years,
-            # climate factors gain importance over time
-            env_weight = 0.8 - (t / years * 0.3)  # Decreases over time
-            climate_weight = 1.0 - env_weight
-            
-            # Calculate final risk score (0-10 scale)
-            risk = (env_risk * env_weight + climate_impact * climate_weight) * 10
-            
-            # Add small random variation representing unpredictable factors
-            random_variation = np.random.normal(0, 0.1)  # Reduced random variation for more stability
-            risk = min(max(risk + random_variation, 0), 10)
-        
-        risks.append(float(risk))
-        
-        # Store factor values for trajectory analysis
-        for i, factor in enumerate(factor_names):
-            idx_adjusted = i + 4  # Adjust for the flattened feature vector
-            feature_trajectories[factor].append(xt[idx_adjusted] * 10)  # Unscale for storing
-        
-        # Update x0 for next iteration
-        x0 = xt
+    # Store initial values followed by the unscaled yearly values
+    feature_trajectories = {
+        factor: [features.get(factor, baseline_features.get()[factor].mean())] + list(states[:, 0, N_ENV + i] * 10)
+        for i, factor in enumerate(FACTOR_NAMES)
+    }
     
+    with metrics.stage("narrative"):
+        narrative = generate_narrative(risks, feature_trajectories, years)
+    return risks, narrative, feature_trajectories
+
+
+def simulate_ensemble(features, years, members, seed=None):
+    """Run a Monte Carlo ensemble around the given features and return percentile bands"""
+    x0 = build_initial_state(features)
+    return flood_simulation.run_ensemble(
+        x0, years, scaler.get(), risk_model=flood_risk_model.get(), nn_model=nn_model.get(),
+        members=members, seed=seed, n_jobs=ensemble_jobs(),
+        nn_model_path=NN_MODEL_PATH
+    )
+
+
+def generate_narrative(risks, feature_trajectories, years):
+    """Describe a simulated risk trajectory in plain language"""
+    factor_changes = {f: feature_trajectories[f][-1] - feature_trajectories[f][0] for f in FACTOR_NAMES}
+    return narrate_trend(risks[0], risks[len(risks)//2], risks[-1], len(risks), factor_changes, years)
+
+
+def narrate_trend(start_risk, mid_risk, end_risk, n_points, factor_changes, years):
+    """Narrative from the summary points of a trajectory, so streamed runs need not keep every year"""
     # Enhanced narrative generation with more detailed trend analysis
     
     # Overall trend
-    start_risk = risks[0]
-    end_risk = risks[-1]
     risk_change = end_risk - start_risk
     
     if risk_change > 5:
@@ -293,9 +502,6 @@ def simulate_and_narrate(features, years=20):
         trend = "decreasing"
         severity = "substantial improvement in"
     
-    # Identify key factors driving the change
-    factor_changes = {f: feature_trajectories[f][-1] - feature_trajectories[f][0] for f in factor_names}
-    
     # Sort factors by absolute change
     driving_factors = sorted(factor_changes.items(), key=lambda x: abs(x[1]), reverse=True)
     
@@ -318,10 +524,10 @@ def simulate_and_narrate(features, years=20):
         narrative += f" The most significant driver is a {abs(top_change):.1f}-point {direction} in {factor_display[top_factor]}."
     
     # Add pattern details
-    if len(risks) > 5:
+    if n_points > 5:
         # Check for acceleration or plateaus
-        first_half_change = risks[len(risks)//2] - risks[0]
-        second_half_change = risks[-1] - risks[len(risks)//2]
+        first_half_change = mid_risk - start_risk
+        second_half_change = end_risk - mid_risk
         
         if abs(second_half_change) > abs(first_half_change) * 1.5:
             narrative += f" The rate of change is accelerating in later years."
@@ -336,7 +542,78 @@ def simulate_and_narrate(features, years=20):
     else:
         narrative += f" This suggests a manageable risk level with proper planning."
     
-    return risks, narrative, feature_trajectories
+    return narrative
+
+
+def narrative_details(risk_model, scenario_factors=None):
+    """Feature-importance and high/low-impact factor sentences that follow the trend narrative
+
+    Returns ``(text, feature_importance)``; without scenario factors the
+    neutral defaults are described.
+    """
+    with metrics.stage("feature_importance"):
+        if scenario_factors is None:
+            feature_importance, environmental_factors = model_feature_importance(risk_model, dict(DEFAULT_CLIMATE_WEIGHTS))
+            if not feature_importance:
+                return "", feature_importance
+            return (f"\n\nModel analysis shows Rainfall ({environmental_factors.get('Rainfall', 0)}%) and Water Level "
+                    f"({environmental_factors.get('Water Level', 0)}%) are the most critical environmental factors for flood risk."), feature_importance
+        
+        feature_importance, environmental_factors = model_feature_importance(risk_model, {
+            factor: round(scenario_factors.get(factor, 5), 2) for factor in FACTOR_NAMES
+        })
+    
+    text = "\n\n"
+    if feature_importance:
+        text += f"Based on our trained model, environmental factors account for {feature_importance['Environmental']['value']}% of flood risk, with Rainfall having {environmental_factors.get('Rainfall', 0)}% importance and Water Level at {environmental_factors.get('Water Level', 0)}% importance.\n\n"
+    
+    high_factors = [k for k, v in scenario_factors.items() if v >= 7]
+    low_factors = [k for k, v in scenario_factors.items() if v <= 3]
+    if high_factors:
+        text += f"High-impact factors: {', '.join(high_factors)}. "
+    if low_factors:
+        text += f"Low-impact factors: {', '.join(low_factors)}. "
+    return text, feature_importance
+
+
+def model_feature_importance(risk_model, climate_factors):
+    """Importance breakdown of the trained risk model, plus the climate factors used"""
+    if risk_model is None:
+        return {}, {}
+    
+    # Extract feature importances from the trained model
+    model_importances = risk_model.feature_importances_
+    model_features = ['Rainfall', 'Water Level', 'Humidity', 'Temperature']
+    
+    # Create normalized importances (sum to 100%)
+    environmental_factors = {}
+    total_importance = sum(model_importances)
+    for i, feature in enumerate(model_features):
+        importance_pct = (model_importances[i] / total_importance) * 100
+        environmental_factors[feature] = round(importance_pct, 2)
+    
+    # Create an importance dictionary for all factors
+    feature_importance = {
+        "Environmental": {
+            "value": round(sum(model_importances) * 100, 2),
+            "factors": environmental_factors
+        },
+        "Climate": {
+            "value": round((1 - sum(model_importances)) * 100, 2),
+            "factors": climate_factors
+        }
+    }
+    return feature_importance, environmental_factors
+
+
+# Weights shown for the climate factors when no scenario text was analysed
+DEFAULT_CLIMATE_WEIGHTS = {
+    "ClimateChange": 25,
+    "Urbanization": 25,
+    "Deforestation": 20,
+    "DrainageSystems": 15,
+    "DamsQuality": 15
+}
 
 
 @app.route('/')
@@ -344,6 +621,472 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/healthz')
+def healthz():
+    """Liveness check with the load state of every model"""
+    return jsonify({
+        "status": "ok",
+        "models": {m.name: m.status() for m in lazy_models}
+    })
+
+
+@app.route('/readyz')
+def readyz():
+    """Readiness check: starts warm-up and reports 503 until every model has loaded or failed"""
+    warm_up_models()
+    ready = all(m.settled for m in lazy_models)
+    return jsonify({
+        "ready": ready,
+        "models": {m.name: m.status() for m in lazy_models}
+    }), 200 if ready else 503
+
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """Counters for the response cache, scenario embedding cache and inference batcher"""
+    scenario = scenario_model.get(wait=False)
+    batcher = scenario_batcher.get(wait=False) if scenario is not None else None
+    return jsonify({
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+        "embedding_cache": scenario.embedding_cache.stats() if scenario is not None else None,
+        "scenario_batcher": batcher.stats() if batcher is not None else None
+    })
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    metrics.current_endpoint.set(request.endpoint or "unknown")
+
+
+@app.after_request
+def record_request_latency(response):
+    # Streamed responses are timed until their headers are sent, not their last chunk
+    start = g.get("request_start")
+    if start is not None:
+        metrics.REQUEST_SECONDS.observe(
+            time.perf_counter() - start, request.endpoint or "unknown", str(response.status_code))
+    return response
+
+
+@metrics.REGISTRY.register_collector
+def collect_model_metrics():
+    """Model load times and states, read from the lazy loaders at scrape time"""
+    models = lazy_models + [scenario_batcher]
+    return [
+        ("floodsense_model_load_seconds", "gauge", "Time taken to load each model",
+         [({"model": m.name}, m.load_seconds) for m in models if m.load_seconds is not None]),
+        ("floodsense_model_state", "gauge", "Load state of each model (1 for the current state)",
+         [({"model": m.name, "state": m.state}, 1) for m in models])
+    ]
+
+
+@metrics.REGISTRY.register_collector
+def collect_scenario_metrics():
+    """Embedding cache and inference batcher counters"""
+    # Only report models that are already loaded; a scrape must never start loading BERT
+    scenario = scenario_model.get() if scenario_model.settled else None
+    if scenario is None:
+        return []
+    families = []
+    cache = scenario.embedding_cache.stats()
+    for key in ("hits", "disk_hits", "misses", "evictions"):
+        families.append((f"floodsense_embedding_cache_{key}_total", "counter",
+                         f"Embedding cache {key.replace('_', ' ')}", [({}, cache[key])]))
+    for key in ("entries", "bytes", "disk_entries"):
+        families.append((f"floodsense_embedding_cache_{key}", "gauge",
+                         f"Embedding cache {key.replace('_', ' ')}", [({}, cache[key])]))
+    batcher = scenario_batcher.get() if scenario_batcher.settled else None
+    if batcher is not None:
+        batch_stats = batcher.stats()
+        for key in ("batches", "items", "rejected"):
+            families.append((f"floodsense_batcher_{key}_total", "counter",
+                             f"Scenario batcher {key}", [({}, batch_stats[key])]))
+        families.append(("floodsense_batcher_pending", "gauge",
+                         "Scenario texts waiting for the batcher", [({}, batch_stats["pending"])]))
+    return families
+
+
+@metrics.REGISTRY.register_collector
+def collect_response_cache_metrics():
+    if response_cache is None:
+        return []
+    stats = response_cache.stats()
+    return [
+        ("floodsense_response_cache_lookups_total", "counter", "/api/simulate response cache lookups by result",
+         [({"result": key}, stats[key]) for key in ("hits", "shared_hits", "coalesced", "misses")]),
+        ("floodsense_response_cache_evictions_total", "counter", "Response cache LRU evictions",
+         [({}, stats["evictions"])]),
+        ("floodsense_response_cache_entries", "gauge", "Responses held in this process",
+         [({}, stats["entries"])])
+    ]
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Per-stage latency histograms and model counters in the Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Retraining publishes a new version to the model registry only if it validates
+# at least this well: its error may exceed the current model's by this fraction
+RETRAIN_TOLERANCE = float(os.environ.get("FLOODSENSE_RETRAIN_TOLERANCE", 0.05))
+# Without FLOODSENSE_VALIDATION_DATA this fraction of the new data is held out of
+# the candidate's training set and both models are compared on it
+RETRAIN_HOLDOUT = float(os.environ.get("FLOODSENSE_RETRAIN_HOLDOUT", 0.2))
+VALIDATION_MAX_ROWS = 20000
+REGISTRY_POLL_SECONDS = float(os.environ.get("FLOODSENSE_REGISTRY_POLL_SECONDS", 2))
+ADMIN_TOKEN = os.environ.get("FLOODSENSE_ADMIN_TOKEN")
+# The only directory retraining may read a server-side 'dataPath' from
+INGEST_DIR = os.environ.get("FLOODSENSE_INGEST_DIR")
+RETRAINABLE_MODELS = ("flood_risk_model", "scenario_model")
+
+retrain_lock = threading.Lock()
+retrain_status = {"running": None, "last": None}
+registry_sync = {"next": 0.0, "lock": threading.Lock()}
+
+
+def loaded_model_versions():
+    """Versions of the models this process is serving right now, without loading any"""
+    versions = {}
+    artifacts = risk_artifacts.get() if risk_artifacts.settled else None
+    if artifacts:
+        versions["flood_risk_model"] = artifacts["version"]
+    scenario = scenario_model.get() if scenario_model.settled else None
+    if scenario is not None:
+        versions["scenario_model"] = scenario.version
+    return versions
+
+
+def build_risk_generation(path):
+    """Values for every risk model slot trained on ``path``, built without touching the live slots"""
+    frame = load_training_data(path)
+    artifacts = load_risk_artifacts(path, frame)
+    if artifacts is None:
+        return None
+    # Insertion order is swap order: the model and its scaler change back to back
+    return {
+        training_data: frame,
+        risk_artifacts: artifacts,
+        flood_risk_model: load_compiled_risk_model(artifacts),
+        scaler: FeatureScaler(artifacts.get("feature_scaler")),
+        baseline_features: build_baseline_features(frame, path)
+    }
+
+
+def swap_models(generation):
+    """Publish new model objects; requests already running finish with the ones they fetched"""
+    for slot, value in generation.items():
+        slot.replace(value)
+
+
+def labelled_frame(frame):
+    """Features and label mean of raw risk rows, in the form load_training_frame returns"""
+    import pandas as pd
+    frame = pd.DataFrame(frame).reindex(columns=FEATURE_COLUMNS + [LABEL_COLUMN])
+    result = pd.DataFrame(frame[FEATURE_COLUMNS].to_numpy(dtype=float), columns=FEATURE_COLUMNS)
+    result[TARGET_COLUMN] = parse_label_means(frame[LABEL_COLUMN].map(str))
+    return result[np.isfinite(result.to_numpy()).all(axis=1)].reset_index(drop=True)
+
+
+def split_holdout(rows):
+    """Shuffle new rows into (training rows, held-out rows), holding out at least one if there are two"""
+    order = np.random.default_rng(0).permutation(len(rows))
+    n_held = min(max(int(round(len(rows) * RETRAIN_HOLDOUT)), 1), len(rows) - 1) if len(rows) > 1 else 0
+    return [rows[i] for i in order[n_held:]], [rows[i] for i in order[:n_held]]
+
+
+def split_holdout_file(source, staging):
+    """Copy the training columns of ``source`` to the CSV ``staging`` minus a held-out sample, which is returned"""
+    import pandas as pd
+    rng = np.random.default_rng(0)
+    held, n_held = [], 0
+    with open(staging, "w", newline="") as out:
+        for i, frame in enumerate(iter_frames(source, FEATURE_COLUMNS + [LABEL_COLUMN], TRAINING_CONFIG["chunk_rows"])):
+            mask = rng.random(len(frame)) < RETRAIN_HOLDOUT
+            # Once enough rows are held out, the rest all go to training
+            mask &= np.cumsum(mask) <= VALIDATION_MAX_ROWS - n_held
+            n_held += int(mask.sum())
+            held.append(frame[mask])
+            frame[~mask].to_csv(out, header=i == 0, index=False)
+    return labelled_frame(pd.concat(held, ignore_index=True)) if held else labelled_frame([])
+
+
+def validate_risk_candidate(generation, holdout=None):
+    """Compare the candidate and current risk models on labelled rows neither was trained on
+
+    These are FLOODSENSE_VALIDATION_DATA if set, else ``holdout``, the part of
+    the new data kept out of the candidate's training set. The current model
+    never saw the new data either, so neither side is scored on its own
+    training rows.
+    """
+    validation_path = os.environ.get("FLOODSENSE_VALIDATION_DATA")
+    if validation_path:
+        frame = load_training_frame(validation_path, TRAINING_CONFIG["chunk_rows"], max_rows=VALIDATION_MAX_ROWS)
+    else:
+        frame = holdout if holdout is not None else labelled_frame([])
+    if len(frame) == 0:
+        return {"metric": "mse", "rows": 0, "passed": False,
+                "reason": "No held-out rows to validate on; send at least two rows or set FLOODSENSE_VALIDATION_DATA"}
+    X, y = frame[FEATURE_COLUMNS].values, frame[TARGET_COLUMN].values
+    
+    candidate_mse = float(np.mean((generation[flood_risk_model].predict(X) - y) ** 2))
+    current = flood_risk_model.get()
+    current_mse = float(np.mean((current.predict(X) - y) ** 2)) if current is not None else None
+    return {
+        "metric": "mse",
+        "candidate": round(candidate_mse, 6),
+        "current": round(current_mse, 6) if current_mse is not None else None,
+        "rows": len(frame),
+        "source": "validation_data" if validation_path else "held_out",
+        "passed": bool(np.isfinite(candidate_mse)
+                       and (current_mse is None or candidate_mse <= current_mse * (1 + RETRAIN_TOLERANCE)))
+    }
+
+
+def validate_scenario_candidate(candidate, held_rows):
+    """Compare the candidate and current scenario models on held-out labelled texts
+
+    Both are scored in the original 1-10 factor units, so their errors are
+    comparable whatever label range each model's scaler was fitted on.
+    """
+    if not held_rows:
+        return {"metric": "mse", "rows": 0, "passed": False,
+                "reason": "No held-out scenarios to validate on; send at least two rows"}
+    texts = [str(row["text"]) for row in held_rows]
+    y = np.array([[float(v) for v in row["labels"]] for row in held_rows])
+    
+    def mse(model):
+        predictions = model.predict_batch(texts)
+        return float(np.mean((np.array([[p[label] for label in model.labels] for p in predictions]) - y) ** 2))
+    
+    current = scenario_model.get()
+    candidate_mse = mse(candidate)
+    current_mse = mse(current) if current is not None else None
+    return {
+        "metric": "mse",
+        "candidate": round(candidate_mse, 6),
+        "current": round(current_mse, 6) if current_mse is not None else None,
+        "rows": len(held_rows),
+        "source": "held_out",
+        "passed": bool(np.isfinite(candidate_mse)
+                       and (current_mse is None or candidate_mse <= current_mse * (1 + RETRAIN_TOLERANCE)))
+    }
+
+
+def snapshot_training_data(name, rows=None, source=None):
+    """Write the active training data plus ``rows``, or the file ``source``, to an immutable snapshot"""
+    import pandas as pd
+    if source is not None:
+        return model_registry.snapshot_data(name, source, os.path.splitext(source)[1])
+    
+    fd, staging = tempfile.mkstemp(prefix=".incoming-", dir=model_registry.root)
+    os.close(fd)
+    try:
+        if name == "scenario_model":
+            from flood_scenario_model import SCENARIO_TRAINING_DATA
+            current = scenario_model.get()
+            scenarios = list(current.training_data if current is not None else SCENARIO_TRAINING_DATA)
+            scenarios += [{"text": str(r["text"]), "labels": [float(v) for v in r["labels"]]} for r in rows]
+            with open(staging, "w") as f:
+                json.dump(scenarios, f)
+            return model_registry.snapshot_data(name, staging, ".json")
+        
+        # New rows take the columns of the current file; label lists are written the way the CSV stores them
+        path = risk_data_path()
+        columns = list(pd.read_csv(path, nrows=0).columns)
+        new_rows = pd.DataFrame([
+            dict(r, **{LABEL_COLUMN: str(list(r[LABEL_COLUMN])) if isinstance(r[LABEL_COLUMN], list) else r[LABEL_COLUMN]})
+            for r in rows
+        ]).reindex(columns=columns)
+        with open(staging, "w", newline="") as out, open(path, newline="") as current_file:
+            shutil.copyfileobj(current_file, out)
+            new_rows.to_csv(out, header=False, index=False)
+        return model_registry.snapshot_data(name, staging, ".csv")
+    finally:
+        os.remove(staging)
+
+
+def retrain(name, rows=None, source=None):
+    """Train a candidate on the new data, validate it and, if it passes, activate and swap it in"""
+    start = time.perf_counter()
+    serving = loaded_model_versions()
+    previous = {"version": serving.get(name), "data": None} if serving.get(name) else None
+    staging = None
+    try:
+        holdout = None
+        if name == "flood_risk_model" and not os.environ.get("FLOODSENSE_VALIDATION_DATA"):
+            # Part of the new data is kept out of training so the comparison is fair
+            if source is not None:
+                os.makedirs(model_registry.root, exist_ok=True)
+                fd, staging = tempfile.mkstemp(prefix=".incoming-", suffix=".csv", dir=model_registry.root)
+                os.close(fd)
+                holdout = split_holdout_file(source, staging)
+                source = staging
+            else:
+                rows, held_rows = split_holdout(rows)
+                holdout = labelled_frame(held_rows)
+        elif name == "scenario_model":
+            # The scenario model is always validated on texts held out of its training set
+            if source is not None:
+                with open(source) as f:
+                    scenarios, holdout = split_holdout(json.load(f))
+                os.makedirs(model_registry.root, exist_ok=True)
+                fd, staging = tempfile.mkstemp(prefix=".incoming-", suffix=".json", dir=model_registry.root)
+                with os.fdopen(fd, "w") as f:
+                    json.dump(scenarios, f)
+                source = staging
+            else:
+                rows, holdout = split_holdout(rows)
+        path = snapshot_training_data(name, rows, source)
+        if name == "flood_risk_model":
+            generation = build_risk_generation(path)
+            if generation is None:
+                raise ValueError(f"No risk model could be trained from {path}")
+            version = generation[risk_artifacts]["version"]
+            validation = validate_risk_candidate(generation, holdout)
+        else:
+            candidate = load_scenario_model(path)
+            generation = {scenario_model: candidate}
+            version = candidate.version
+            validation = validate_scenario_candidate(candidate, holdout)
+        
+        result = {"model": name, "version": version, "data": path, "validation": validation}
+        if validation["passed"]:
+            model_registry.activate(name, {"version": version, "data": path, "validation": validation}, previous)
+            model_registry.changed()  # This process is already up to date
+            swap_models(generation)
+            print(f"Activated {version}: {validation}")
+        else:
+            print(f"Rejected {version}: {validation}")
+    except Exception as e:
+        print(f"Retraining {name} failed: {e}")
+        result = {"model": name, "error": str(e)}
+    finally:
+        if staging is not None and os.path.exists(staging):
+            os.remove(staging)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    retrain_status["last"] = result
+    retrain_status["running"] = None
+    retrain_lock.release()
+
+
+def reload_active_models():
+    """Swap in whichever versions the registry names, e.g. after another worker retrained or a rollback"""
+    with registry_sync["lock"]:
+        serving = loaded_model_versions()
+        risk_entry = model_registry.active("flood_risk_model")
+        if risk_entry and serving.get("flood_risk_model") not in (None, risk_entry["version"]):
+            generation = build_risk_generation(risk_data_path())
+            if generation is not None:
+                swap_models(generation)
+                print(f"Swapped in {risk_entry['version']}")
+        scenario_entry = model_registry.active("scenario_model")
+        if scenario_entry and serving.get("scenario_model") not in (None, scenario_entry["version"]):
+            swap_models({scenario_model: load_scenario_model()})
+            print(f"Swapped in {scenario_entry['version']}")
+
+
+@app.before_request
+def sync_model_registry():
+    # At most one stat per poll interval; any reload runs off the request thread
+    now = time.monotonic()
+    if now < registry_sync["next"]:
+        return
+    registry_sync["next"] = now + REGISTRY_POLL_SECONDS
+    # While a reload runs the change is left unseen, so a later poll picks it up
+    if registry_sync["lock"].locked():
+        return
+    if model_registry.changed():
+        threading.Thread(target=reload_active_models, name="model-reload", daemon=True).start()
+
+
+@app.after_request
+def add_model_version(response):
+    versions = loaded_model_versions()
+    if versions:
+        response.headers["X-Model-Version"] = ", ".join(f"{name}={v}" for name, v in sorted(versions.items()))
+    return response
+
+
+def admin_error():
+    """An error response unless the request carries FLOODSENSE_ADMIN_TOKEN; without one set, admin endpoints are off"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Model administration is disabled; set FLOODSENSE_ADMIN_TOKEN to enable it"}), 403
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Admin token required"}), 403
+    return None
+
+
+def ingest_path(source):
+    """Resolve a requested 'dataPath' inside FLOODSENSE_INGEST_DIR, or None if it points anywhere else"""
+    if not INGEST_DIR:
+        return None
+    root = os.path.realpath(INGEST_DIR)
+    path = os.path.realpath(os.path.join(root, source))
+    return path if os.path.commonpath([root, path]) == root else None
+
+
+@app.route('/api/models')
+def model_status():
+    """Versions being served, the registry's active versions and rollback history, and retraining state"""
+    return jsonify({
+        "serving": loaded_model_versions(),
+        "registry": model_registry.read(),
+        "retrain": retrain_status
+    })
+
+
+@app.route('/api/models/retrain', methods=['POST'])
+def start_retrain():
+    """Retrain a model in the background on its current data plus new labelled rows"""
+    error = admin_error()
+    if error:
+        return error
+    data = request.json or {}
+    name = data.get('model', 'flood_risk_model')
+    rows = data.get('rows') or []
+    source = data.get('dataPath')
+    if name not in RETRAINABLE_MODELS:
+        return jsonify({"error": f"'model' must be one of {list(RETRAINABLE_MODELS)}"}), 400
+    if not rows and not source:
+        return jsonify({"error": "Send new labelled 'rows' or a server-side 'dataPath' to train on"}), 400
+    if source:
+        path = ingest_path(source)
+        if path is None:
+            return jsonify({"error": "'dataPath' must name a file inside FLOODSENSE_INGEST_DIR"}), 400
+        if not os.path.isfile(path):
+            return jsonify({"error": f"No data file at {source}"}), 400
+        source = path
+    required = ["text", "labels"] if name == "scenario_model" else FEATURE_COLUMNS + [LABEL_COLUMN]
+    if any(not isinstance(row, dict) or any(k not in row for k in required) for row in rows):
+        return jsonify({"error": f"Every row needs {required}"}), 400
+    if not retrain_lock.acquire(blocking=False):
+        return jsonify({"error": "A retraining run is already in progress", "retrain": retrain_status}), 409
+    
+    retrain_status["running"] = {"model": name, "rows": len(rows), "dataPath": source,
+                                 "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    threading.Thread(target=retrain, args=(name, rows, source), name=f"retrain-{name}", daemon=True).start()
+    return jsonify({"retrain": retrain_status}), 202
+
+
+@app.route('/api/models/rollback', methods=['POST'])
+def rollback_model():
+    """Reactivate the previous version of a model in every worker"""
+    error = admin_error()
+    if error:
+        return error
+    name = (request.json or {}).get('model', 'flood_risk_model')
+    if name not in RETRAINABLE_MODELS:
+        return jsonify({"error": f"'model' must be one of {list(RETRAINABLE_MODELS)}"}), 400
+    try:
+        entry = model_registry.rollback(name)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    threading.Thread(target=reload_active_models, name="model-reload", daemon=True).start()
+    return jsonify({"model": name, "active": entry}), 202
+
+
 @app.route('/api/predict', methods=['POST'])
 def predict():
     """API endpoint for basic prediction"""
@@ -354,6 +1097,8 @@ def predict():
     water_level = float(data.get('waterLevel', 0))
     humidity = float(data.get('humidity', 0))
     temperature = float(data.get('temperature', 0))
+    if not np.isfinite([rainfall, water_level, humidity, temperature]).all():
+        return jsonify({"error": "rainfall, waterLevel, humidity and temperature must be finite numbers"}), 400
     
     # Normalize inputs (simple method)
     normalized_rainfall = min(rainfall / 200.0, 1.0)
@@ -367,8 +1112,20 @@ def predict():
                 normalized_humidity * 0.2 + 
                 normalized_temperature * 0.1)
     
+    # Use the neural network once it has loaded; don't hold the request up waiting for it
+    model = nn_model.get(wait=False)
+    table = predict_table.get(wait=False)
+    interpolation_error = None
+    
+    if table is not None:
+        # O(1) lookup in the precomputed risk surface of the same model
+        grid, source = table
+        risk_score = grid.interpolate([rainfall, water_level, humidity, temperature])
+        interpolation_error = grid.max_error
+        if source == "formula":
+            risk_score = min(risk_score + np.random.normal(0, 5), 100)
     # Add random variation for demonstration (would use actual model in production)
-    if model is None:
+    elif model is None:
         risk_score = min(base_risk * 100 + np.random.normal(0, 5), 100)
     else:
         # Here you would prepare inputs for your specific model architecture
@@ -402,13 +1159,117 @@ def predict():
         "temperature": normalized_temperature * 0.1 / base_risk * 100 if base_risk > 0 else 25
     }
     
-    return jsonify({
+    response = {
         "level": risk_level,
         "message": message,
         "probability": float(risk_score),
         "factorScores": factor_scores,
         "totalScore": float(risk_score)
-    })
+    }
+    if interpolation_error is not None:
+        # Largest error of the lookup table against the live model, measured when it was built
+        response["interpolationMaxError"] = round(interpolation_error, 4)
+    return jsonify(response)
+
+
+def create_response_cache():
+    """Cache for /api/simulate responses; FLOODSENSE_RESPONSE_CACHE_SIZE=0 disables it"""
+    max_entries = int(os.environ.get("FLOODSENSE_RESPONSE_CACHE_SIZE", 1024))
+    if max_entries <= 0:
+        return None
+    return ResponseCache(
+        max_entries=max_entries,
+        ttl=float(os.environ.get("FLOODSENSE_RESPONSE_CACHE_TTL", 300)),
+        shared_path=os.environ.get("FLOODSENSE_RESPONSE_CACHE_DIR") or None
+    )
+
+
+response_cache = create_response_cache()
+
+# Responses built without the scenario model (it failed or is unavailable) are
+# only kept briefly, so they stop being served soon after it recovers
+RESPONSE_CACHE_FALLBACK_TTL = float(os.environ.get("FLOODSENSE_RESPONSE_CACHE_FALLBACK_TTL", 10))
+
+
+def response_ttl(response):
+    """Cache TTL of a /api/simulate response; only the scenario model's responses carry scenario_factors"""
+    return response_cache.ttl if "scenario_factors" in response else RESPONSE_CACHE_FALLBACK_TTL
+
+# Inputs are rounded to these steps so dashboards polling almost the same
+# conditions share cache entries
+SIMULATE_INPUT_STEPS = {"rainfall": 1.0, "waterLevel": 0.05, "humidity": 1.0, "temperature": 0.5}
+
+
+# Hard limits that keep every simulation request bounded in time, memory and response size
+SIM_MAX_STEPS = int(os.environ.get("FLOODSENSE_SIM_MAX_STEPS", 2400))
+SIM_MAX_POINTS = int(os.environ.get("FLOODSENSE_SIM_MAX_POINTS", 1000))
+SIM_CHUNK_YEARS = int(os.environ.get("FLOODSENSE_SIM_CHUNK_YEARS", 10))
+# Ensembles keep every member's trajectory for their percentiles, so members x years is capped
+SIM_MAX_CELLS = int(os.environ.get("FLOODSENSE_SIM_MAX_CELLS", 1000000))
+STEPS_PER_YEAR = {"annual": 1, "seasonal": 4, "monthly": 12}
+
+
+def horizon_error(years, steps_per_year=1, minimum=1):
+    """A 400 response for a horizon that is too short or over the step limit, else None"""
+    if years < minimum:
+        return jsonify({"error": f"'years' must be at least {minimum}"}), 400
+    if years * steps_per_year > SIM_MAX_STEPS:
+        return jsonify({"error": f"{years} years at {steps_per_year} steps per year exceeds the limit of "
+                                 f"{SIM_MAX_STEPS} simulation steps"}), 400
+    return None
+
+
+# score_states prefers the trained risk model, which is fitted on the four
+# environmental measurements only; the scenario factors cannot move its output
+FACTORS_IGNORED_NOTE = ("The trained risk model only uses rainfall, water level, humidity and temperature, "
+                        "so scenario factors do not change the risk it predicts")
+
+
+def factors_affect_risk(risk_model):
+    """Whether the scenario factors reach the risk score: only the network and rule-based fallbacks use them"""
+    return risk_model is None
+
+
+def model_versions():
+    """Versions of the models that shape a simulation, part of the response cache key"""
+    artifacts = risk_artifacts.get() or {}
+    scenario = scenario_model.get()
+    return {
+        "risk_model": artifacts.get("version"),
+        "scenario_model": getattr(scenario, "version", None),
+        "nn_model": NN_MODEL_PATH if nn_model.get() is not None else None,
+        "scenario_index": getattr(scenario_index.get(), "version", None)
+    }
+
+
+def exported_risk_model():
+    """The risk model and its scaler as JSON for client-side scoring, or None if there is none to export"""
+    artifacts = risk_artifacts.get() or {}
+    compiled = flood_risk_model.get()
+    if not isinstance(compiled, CompiledTreeEnsemble):
+        return None
+    version = artifacts.get("version")
+    if version not in exported_models:
+        exported_models.clear()
+        exported_models[version] = export_model(compiled, FEATURE_COLUMNS, artifacts.get("feature_scaler"), version)
+    return exported_models[version]
+
+
+exported_models = {}
+
+
+@app.route('/api/model/export')
+def export_risk_model():
+    """Serve the trained risk model so the browser can score what-if inputs locally"""
+    doc = exported_risk_model()
+    if doc is None:
+        return jsonify({"error": "No exportable risk model is available"}), 404
+    response = jsonify(doc)
+    # Clients revalidate with If-None-Match and only download a new model version
+    response.set_etag(str(doc["modelVersion"]))
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+    return response.make_conditional(request)
 
 
 @app.route('/api/simulate', methods=['POST'])
@@ -416,21 +1277,59 @@ def run_simulation():
     """API endpoint for long-term simulation"""
     data = request.json
     
-    # Extract basic features
-    rainfall = float(data.get('rainfall', 50))
-    water_level = float(data.get('waterLevel', 2))
-    humidity = float(data.get('humidity', 60))
-    temperature = float(data.get('temperature', 20))
+    # Extract basic features, rounded to the cache steps when the cache is on
+    inputs = {name: float(data.get(name, default)) for name, default in
+              (("rainfall", 50), ("waterLevel", 2), ("humidity", 60), ("temperature", 20))}
+    if response_cache is not None:
+        inputs = {name: quantize(value, SIMULATE_INPUT_STEPS[name]) for name, value in inputs.items()}
     
     # Extract scenario text and years
     scenario_text = data.get('scenario', '')
     years = int(data.get('years', 20))
+    error = horizon_error(years)
+    if error:
+        return error
+    
+    # Number of Monte Carlo members (0 disables the ensemble) and its seed
+    ensemble_members = int(data.get('ensemble', 0))
+    seed = int(data['seed']) if data.get('seed') is not None else None
+    if ensemble_members:
+        members = min(max(ensemble_members, 1), flood_simulation.MAX_ENSEMBLE_MEMBERS)
+        if members * years > SIM_MAX_CELLS:
+            return jsonify({"error": f"An ensemble of {members} members over {years} years exceeds the limit of "
+                                     f"{SIM_MAX_CELLS} member-years; use fewer members or a shorter horizon"}), 400
+    
+    def compute():
+        return simulation_response(inputs["rainfall"], inputs["waterLevel"], inputs["humidity"],
+                                   inputs["temperature"], scenario_text, years, ensemble_members, seed)
+    
+    try:
+        # An unseeded ensemble is random by design, so it is never served from the cache
+        if response_cache is None or (ensemble_members and seed is None):
+            response, source = compute(), "bypass"
+        else:
+            key = cache_key(inputs, text_key(scenario_text), years, ensemble_members, seed, model_versions())
+            response, source = response_cache.get_or_compute(key, compute, ttl_of=response_ttl)
+    except QueueFullError as e:
+        # Back-pressure: ask the client to retry rather than queueing without bound
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+    
+    with metrics.stage("serialize"):
+        return jsonify(response), 200, {"X-Cache": source}
+
+
+def simulation_response(rainfall, water_level, humidity, temperature, scenario_text, years, ensemble_members=0, seed=None):
+    """Build the /api/simulate response body"""
+    # Models are loaded on first use
+    batcher = scenario_batcher.get()
+    risk_model = flood_risk_model.get()
     
     # Use the new scenario model if available
-    if scenario_model is not None:
+    if batcher is not None:
         try:
-            # Get predictions from the BERT model
-            scenario_factors = scenario_model.predict(scenario_text)
+            # Get predictions from the BERT model, batched with concurrent requests
+            with metrics.stage("scenario_predict"):
+                scenario_factors = batcher.submit(scenario_text)
             
             # Map the scenario factors to our simulation features
             features = {
@@ -449,53 +1348,8 @@ def run_simulation():
             risks, narrative, feature_trajectories = simulate_and_narrate(features, years)
             
             # Create a more detailed narrative based on scenario factors
-            high_factors = [k for k, v in scenario_factors.items() if v >= 7]
-            low_factors = [k for k, v in scenario_factors.items() if v <= 3]
-            
-            detailed_narrative = narrative + "\n\n"
-            
-            # Get feature importance information from the trained model
-            feature_importance = {}
-            environmental_factors = {}
-            
-            if flood_risk_model is not None:
-                # Extract feature importances from the trained model
-                model_importances = flood_risk_model.feature_importances_
-                model_features = ['Rainfall', 'Water Level', 'Humidity', 'Temperature']
-                
-                # Create normalized importances (sum to 100%)
-                total_importance = sum(model_importances)
-                for i, feature in enumerate(model_features):
-                    importance_pct = (model_importances[i] / total_importance) * 100
-                    environmental_factors[feature] = round(importance_pct, 2)
-                
-                # Calculate estimated factor contributions to the prediction
-                base_env_value = rainfall * model_importances[0] + \
-                                 water_level * model_importances[1] + \
-                                 humidity * model_importances[2] + \
-                                 temperature * model_importances[3]
-                
-                # Create an importance dictionary for all factors
-                feature_importance = {
-                    "Environmental": {
-                        "value": round(sum(model_importances) * 100, 2),
-                        "factors": environmental_factors
-                    },
-                    "Climate": {
-                        "value": round((1 - sum(model_importances)) * 100, 2),
-                        "factors": {
-                            factor: round(scenario_factors.get(factor, 5), 2) 
-                            for factor in ["ClimateChange", "Urbanization", "Deforestation", "DrainageSystems", "DamsQuality"]
-                        }
-                    }
-                }
-                
-                detailed_narrative += f"Based on our trained model, environmental factors account for {feature_importance['Environmental']['value']}% of flood risk, with Rainfall having {environmental_factors.get('Rainfall', 0)}% importance and Water Level at {environmental_factors.get('Water Level', 0)}% importance.\n\n"
-            
-            if high_factors:
-                detailed_narrative += f"High-impact factors: {', '.join(high_factors)}. "
-            if low_factors:
-                detailed_narrative += f"Low-impact factors: {', '.join(low_factors)}. "
+            details, feature_importance = narrative_details(risk_model, scenario_factors)
+            detailed_narrative = narrative + details
             
             response = {
                 "risks": [round(r, 2) for r in risks],
@@ -512,7 +1366,14 @@ def run_simulation():
                 "feature_importance": feature_importance
             }
             
-            return jsonify(response)
+            # Optional Monte Carlo ensemble with uncertainty bands
+            if ensemble_members:
+                with metrics.stage("ensemble"):
+                    response["ensemble"] = simulate_ensemble(features, years, ensemble_members, seed)
+            
+            return response
+        except QueueFullError:
+            raise
         except Exception as e:
             print(f"Error in scenario simulation: {e}")
     
@@ -532,41 +1393,9 @@ def run_simulation():
     # Run simulation with default features
     risks, narrative, feature_trajectories = simulate_and_narrate(features, years)
     
-    # Get feature importance information from the trained model
-    feature_importance = {}
-    
-    if flood_risk_model is not None:
-        # Extract feature importances from the trained model
-        model_importances = flood_risk_model.feature_importances_
-        model_features = ['Rainfall', 'Water Level', 'Humidity', 'Temperature']
-        
-        # Calculate environmental factor importances
-        environmental_factors = {}
-        total_importance = sum(model_importances)
-        for i, feature in enumerate(model_features):
-            importance_pct = (model_importances[i] / total_importance) * 100
-            environmental_factors[feature] = round(importance_pct, 2)
-        
-        # Create an importance dictionary for all factors
-        feature_importance = {
-            "Environmental": {
-                "value": round(sum(model_importances) * 100, 2),
-                "factors": environmental_factors
-            },
-            "Climate": {
-                "value": round((1 - sum(model_importances)) * 100, 2),
-                "factors": {
-                    "ClimateChange": 25,
-                    "Urbanization": 25,
-                    "Deforestation": 20,
-                    "DrainageSystems": 15,
-                    "DamsQuality": 15
-                }
-            }
-        }
-        
-        # Add feature importance information to the narrative
-        narrative += f"\n\nModel analysis shows Rainfall ({environmental_factors.get('Rainfall', 0)}%) and Water Level ({environmental_factors.get('Water Level', 0)}%) are the most critical environmental factors for flood risk."
+    # Add feature importance information to the narrative
+    details, feature_importance = narrative_details(risk_model)
+    narrative += details
     
     response = {
         "risks": [round(r, 2) for r in risks],
@@ -577,8 +1406,503 @@ def run_simulation():
         "feature_importance": feature_importance
     }
     
+    # Optional Monte Carlo ensemble with uncertainty bands
+    if ensemble_members:
+        with metrics.stage("ensemble"):
+            response["ensemble"] = simulate_ensemble(features, years, ensemble_members, seed)
+    
+    return response
+
+
+@app.route('/api/simulate/stream', methods=['POST'])
+def stream_simulation():
+    """Streaming variant of /api/simulate that sends trajectories as NDJSON chunks"""
+    data = request.json
+    
+    rainfall = float(data.get('rainfall', 50))
+    water_level = float(data.get('waterLevel', 2))
+    humidity = float(data.get('humidity', 60))
+    temperature = float(data.get('temperature', 20))
+    scenario_text = data.get('scenario', '')
+    years = int(data.get('years', 20))
+    chunk_years = max(1, int(data.get('chunkYears', 10)))
+    error = horizon_error(years)
+    if error:
+        return error
+    
+    features = {
+        "Rainfall": rainfall,
+        "WaterLevel": water_level,
+        "Humidity": humidity,
+        "Temperature": temperature
+    }
+    
+    # Score the scenario text up front, falling back to neutral factors
+    scenario_factors = None
+    batcher = scenario_batcher.get()
+    if batcher is not None:
+        try:
+            with metrics.stage("scenario_predict"):
+                scenario_factors = batcher.submit(scenario_text)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        except Exception as e:
+            print(f"Error in scenario prediction: {e}")
+    climate = {f: scenario_factors[f] if scenario_factors else 5.0 for f in FACTOR_NAMES}
+    
+    def generate():
+        risk_model = flood_risk_model.get()
+        x0 = build_initial_state(dict(features, **climate))
+        yield json.dumps({
+            "type": "start",
+            "years": years,
+            "features": features,
+            "scenario_factors": {k: float(v) for k, v in scenario_factors.items()} if scenario_factors else None,
+            "initial_factors": {f: round(float(climate[f]), 2) for f in FACTOR_NAMES}
+        }) + "\n"
+        
+        # Only the points the narrative needs are kept, never the whole trajectory
+        start_risk = mid_risk = end_risk = None
+        for first_year, risks, states in flood_simulation.iter_simulation(
+                x0, years, scaler.get(), risk_model=risk_model, nn_model=nn_model.get(), chunk_years=chunk_years):
+            risks = risks[:, 0]
+            if start_risk is None:
+                start_risk = float(risks[0])
+            if first_year <= years // 2 < first_year + len(risks):
+                mid_risk = float(risks[years // 2 - first_year])
+            end_risk = float(risks[-1])
+            last_factors = states[-1, 0, N_ENV:] * 10
+            yield json.dumps({
+                "type": "chunk",
+                "years": list(range(first_year, first_year + len(risks))),
+                "risks": [round(float(r), 2) for r in risks],
+                "feature_trajectories": {
+                    f: [round(float(v), 2) for v in states[:, 0, N_ENV + i] * 10] for i, f in enumerate(FACTOR_NAMES)
+                }
+            }) + "\n"
+        
+        if start_risk is None:
+            return
+        factor_changes = {f: last_factors[i] - climate[f] for i, f in enumerate(FACTOR_NAMES)}
+        narrative = narrate_trend(start_risk, mid_risk, end_risk, years, factor_changes, years)
+        # The same closing sentences as /api/simulate
+        details, feature_importance = narrative_details(risk_model, scenario_factors)
+        narrative += details
+        yield json.dumps({
+            "type": "end",
+            "narrative": narrative,
+            "feature_importance": feature_importance
+        }) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/simulate/long', methods=['POST'])
+def long_simulation():
+    """Long-horizon simulation at annual, seasonal or monthly steps, returned as a bounded series"""
+    data = request.json
+    years = int(data.get('years', 100))
+    resolution = data.get('resolution', 'annual')
+    if resolution not in STEPS_PER_YEAR:
+        return jsonify({"error": f"'resolution' must be one of {list(STEPS_PER_YEAR)}"}), 400
+    steps_per_year = STEPS_PER_YEAR[resolution]
+    error = horizon_error(years, steps_per_year)
+    if error:
+        return error
+    n_steps = years * steps_per_year
+    
+    # Either min/mean/max per period of aggregateYears, or every sampleEvery-th step
+    aggregate_years = data.get('aggregateYears')
+    if aggregate_years is not None:
+        period = max(1, int(round(float(aggregate_years) * steps_per_year)))
+    else:
+        period = max(1, int(data.get('sampleEvery', 1)))
+    n_points = -(-n_steps // period)
+    if n_points > SIM_MAX_POINTS:
+        return jsonify({"error": f"The series would have {n_points} points, more than the limit of {SIM_MAX_POINTS}; "
+                                 f"set a coarser 'aggregateYears' or 'sampleEvery'"}), 400
+    
+    features = {
+        "Rainfall": float(data.get('rainfall', 50)),
+        "WaterLevel": float(data.get('waterLevel', 2)),
+        "Humidity": float(data.get('humidity', 60)),
+        "Temperature": float(data.get('temperature', 20))
+    }
+    scenario_text = data.get('scenario', '')
+    scenario_factors = None
+    batcher = scenario_batcher.get()
+    if batcher is not None:
+        try:
+            with metrics.stage("scenario_predict"):
+                scenario_factors = batcher.submit(scenario_text)
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        except Exception as e:
+            print(f"Error in scenario prediction: {e}")
+    climate = {f: scenario_factors[f] if scenario_factors else 5.0 for f in FACTOR_NAMES}
+    
+    with metrics.stage("initial_state"):
+        x0 = build_initial_state(dict(features, **climate))
+        feature_scaler, risk_model, network = scaler.get(), flood_risk_model.get(), nn_model.get()
+    
+    # Steps are simulated and scored a chunk at a time; only the output points
+    # and the narrative's summary risks outlive each chunk
+    aggregator = flood_simulation.SeriesAggregator(period) if aggregate_years is not None else None
+    sampled_steps, sampled_risks, factor_points = [], [], []
+    start_risk = mid_risk = end_risk = None
+    with metrics.stage("year_loop"):
+        for first_step, risks, states in flood_simulation.iter_simulation(
+                x0, years, feature_scaler, risk_model, network, chunk_years=SIM_CHUNK_YEARS,
+                steps_per_year=steps_per_year):
+            risks = risks[:, 0]
+            steps = first_step + np.arange(len(risks))
+            if start_risk is None:
+                start_risk = float(risks[0])
+            if first_step <= n_steps // 2 < first_step + len(risks):
+                mid_risk = float(risks[n_steps // 2 - first_step])
+            end_risk = float(risks[-1])
+            last_factors = states[-1, 0, N_ENV:] * 10
+            
+            if aggregator is not None:
+                aggregator.add(risks[:, np.newaxis])
+                # Factors are reported as of the last step of each period
+                points = ((steps + 1) % period == 0) | (steps == n_steps - 1)
+            else:
+                points = steps % period == 0
+                sampled_steps.extend(steps[points].tolist())
+                sampled_risks.extend(risks[points].tolist())
+            factor_points.extend(states[points, 0, N_ENV:] * 10)
+    
+    with metrics.stage("narrative"):
+        factor_changes = {f: last_factors[i] - climate[f] for i, f in enumerate(FACTOR_NAMES)}
+        narrative = narrate_trend(start_risk, mid_risk, end_risk, n_steps, factor_changes, years)
+    
+    with metrics.stage("serialize"):
+        if aggregator is not None:
+            periods = aggregator.finish()
+            series = {
+                "start": [round(p["first_step"] / steps_per_year, 3) for p in periods],
+                "end": [round((p["first_step"] + p["steps"]) / steps_per_year, 3) for p in periods],
+                "min": [round(float(p["min"][0]), 2) for p in periods],
+                "mean": [round(float(p["mean"][0]), 2) for p in periods],
+                "max": [round(float(p["max"][0]), 2) for p in periods]
+            }
+        else:
+            series = {
+                "time": [round(step / steps_per_year, 3) for step in sampled_steps],
+                "risk": [round(float(r), 2) for r in sampled_risks]
+            }
+        return jsonify({
+            "years": years,
+            "resolution": resolution,
+            "stepsPerYear": steps_per_year,
+            "steps": n_steps,
+            "points": n_points,
+            "series": series,
+            "feature_trajectories": {
+                f: [round(float(v[i]), 2) for v in factor_points] for i, f in enumerate(FACTOR_NAMES)
+            },
+            "initial_factors": {f: round(float(climate[f]), 2) for f in FACTOR_NAMES},
+            "scenario_factors": {k: float(v) for k, v in scenario_factors.items()} if scenario_factors else None,
+            "narrative": narrative
+        })
+
+
+# Features /api/explain attributes risk to, in simulation state order, and their valid ranges
+EXPLAIN_FEATURES = ENV_NAMES + FACTOR_NAMES
+EXPLAIN_LOWS = np.array(PREDICT_LOWS + [0.0] * len(FACTOR_NAMES))
+EXPLAIN_HIGHS = np.array(PREDICT_HIGHS + [10.0] * len(FACTOR_NAMES))
+EXPLAIN_MAX_SAMPLES = int(os.environ.get("FLOODSENSE_EXPLAIN_MAX_SAMPLES", 256))
+
+
+def build_initial_states(feature_rows):
+    """Scaled (scenarios x 9) simulation states for rows of raw values in EXPLAIN_FEATURES order"""
+    feature_rows = np.asarray(feature_rows, dtype=float)
+    x0 = np.empty_like(feature_rows)
+    x0[:, :N_ENV] = scaler.get().transform(feature_rows[:, :N_ENV])
+    x0[:, N_ENV:] = feature_rows[:, N_ENV:] / 10.0
+    return x0
+
+
+def simulated_risk(feature_rows, years):
+    """Mean simulated risk over ``years`` for each row of raw feature values
+
+    All rows are stepped together, a chunk of years at a time, so memory is
+    bounded by the chunk rather than the horizon.
+    """
+    x0 = build_initial_states(feature_rows)
+    total = np.zeros(len(x0))
+    # No noise, so differences between rows come from the features alone
+    for _, risks, _ in flood_simulation.iter_simulation(x0, years, scaler.get(), flood_risk_model.get(), nn_model.get(),
+                                                        chunk_years=SIM_CHUNK_YEARS, noise=0.0):
+        total += risks.sum(axis=0)
+    return total / years
+
+
+@app.route('/api/explain', methods=['POST'])
+def explain():
+    """Local attribution of the simulated risk to each environmental and scenario factor"""
+    data = request.json
+    years = max(1, int(data.get('years', 20)))
+    error = horizon_error(years)
+    if error:
+        return error
+    method = data.get('method', 'shapley')
+    samples = min(max(1, int(data.get('samples', 64))), EXPLAIN_MAX_SAMPLES)
+    seed = int(data.get('seed', 0))
+    if method not in ('shapley', 'oat'):
+        return jsonify({"error": f"Unknown method '{method}', expected 'shapley' or 'oat'"}), 400
+    # Every perturbed input is simulated for the whole horizon, so their product is capped like ensembles
+    evaluations = samples * (len(EXPLAIN_FEATURES) + 1) if method == 'shapley' else 2 * len(EXPLAIN_FEATURES) + 1
+    if evaluations * years > SIM_MAX_CELLS:
+        return jsonify({"error": f"{evaluations} perturbed inputs over {years} years exceeds the limit of "
+                                 f"{SIM_MAX_CELLS} input-years; use fewer 'samples' or a shorter horizon"}), 400
+    
+    features = {
+        "Rainfall": float(data.get('rainfall', 50)),
+        "WaterLevel": float(data.get('waterLevel', 2)),
+        "Humidity": float(data.get('humidity', 60)),
+        "Temperature": float(data.get('temperature', 20))
+    }
+    
+    # Scenario factors come from the scenario text, explicit values override them
+    climate = dict.fromkeys(FACTOR_NAMES, 5.0)
+    scenario_text = data.get('scenario')
+    batcher = scenario_batcher.get() if scenario_text else None
+    if batcher is not None:
+        try:
+            with metrics.stage("scenario_predict"):
+                climate.update(batcher.submit(scenario_text))
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        except Exception as e:
+            print(f"Error in scenario prediction: {e}")
+    climate.update({f: float(v) for f, v in (data.get('factors') or {}).items() if f in climate})
+    features.update(climate)
+    x = np.array([features[f] for f in EXPLAIN_FEATURES])
+    
+    def value_fn(rows):
+        return simulated_risk(rows, years)
+    
+    # Every perturbed input is scored in a single simulation and model call
+    with metrics.stage("explain_batch"):
+        if method == 'shapley':
+            # Attributions are relative to typical training conditions with neutral factors
+            reference = baseline_features.get()
+            baseline = np.array([float(reference[f].mean()) if f in ENV_NAMES else 5.0 for f in EXPLAIN_FEATURES])
+            result = sampled_shapley(value_fn, x, baseline, samples, seed)
+        else:
+            # Perturb each feature by 5% of its range
+            deltas = (EXPLAIN_HIGHS - EXPLAIN_LOWS) * 0.05
+            result = one_at_a_time(value_fn, x, deltas, EXPLAIN_LOWS, EXPLAIN_HIGHS)
+    
+    factors_used = factors_affect_risk(flood_risk_model.get())
+    response = {
+        "method": method,
+        "years": years,
+        "features": {f: round(float(v), 2) for f, v in zip(EXPLAIN_FEATURES, x)},
+        "prediction": round(result["prediction"], 4),
+        "attributions": {f: round(float(v), 4) for f, v in zip(EXPLAIN_FEATURES, result["attributions"])},
+        "evaluations": result["evaluations"],
+        # Zero factor attributions then mean the model cannot see the factors, not that they do not matter
+        "factorsAffectRisk": factors_used,
+        "note": None if factors_used else FACTORS_IGNORED_NOTE + "; their attributions are 0"
+    }
+    if method == 'shapley':
+        response["baseline"] = {f: round(float(v), 2) for f, v in zip(EXPLAIN_FEATURES, baseline)}
+        response["baselinePrediction"] = round(result["baseline_prediction"], 4)
+        response["samples"] = samples
+        response["standardErrors"] = {f: round(float(v), 4) for f, v in zip(EXPLAIN_FEATURES, result["standard_errors"])}
+    else:
+        response["deltas"] = {f: round(float(v), 4) for f, v in zip(EXPLAIN_FEATURES, deltas)}
     return jsonify(response)
 
 
+SIMILAR_MAX_K = 50
+
+
+@app.route('/api/scenarios/similar', methods=['POST'])
+def similar_scenarios():
+    """The known scenarios closest to a scenario text, with their labelled factor scores"""
+    data = request.json
+    scenario_text = str(data.get('scenario', ''))
+    k = min(max(1, int(data.get('k', 5))), SIMILAR_MAX_K)
+    index = scenario_index.get()
+    if index is None:
+        return jsonify({"error": "No scenario index is configured (set FLOODSENSE_SCENARIO_INDEX)"}), 404
+    
+    # A known text is searched with its stored embedding, so the encoder never runs
+    match = index.match_text(scenario_text)
+    if match is not None:
+        query = index.embeddings[match[0]]
+    else:
+        model = scenario_model.get()
+        if model is None:
+            return jsonify({"error": "The scenario model is unavailable to encode the text"}), 503
+        if model.encoder.name != index.encoder_name:
+            return jsonify({"error": f"The index was built with the {index.encoder_name} encoder "
+                                     f"but the server uses {model.encoder.name}"}), 409
+        with metrics.stage("encode"):
+            query = model.encode_batch([scenario_text])[0]
+    with metrics.stage("index_search"):
+        rows, similarities = index.search(query, k)
+    
+    return jsonify({
+        "scenario": scenario_text,
+        "match": dict(index.neighbours([match[0]], [1.0])[0], type=match[1]) if match is not None else None,
+        "neighbours": index.neighbours(rows[0], similarities[0]),
+        "indexVersion": index.version
+    })
+
+
+COMPARE_MAX_SCENARIOS = int(os.environ.get("FLOODSENSE_COMPARE_MAX_SCENARIOS", 50))
+COMPARE_METRICS = ("mean", "final", "peak")
+
+
+@app.route('/api/simulate/compare', methods=['POST'])
+def compare_scenarios():
+    """Simulate several scenario texts for one site together and rank them by risk"""
+    data = request.json
+    scenarios = data.get('scenarios') or []
+    years = max(1, int(data.get('years', 20)))
+    error = horizon_error(years)
+    if error:
+        return error
+    rank_by = data.get('rankBy', 'mean')
+    if not isinstance(scenarios, list) or not scenarios:
+        return jsonify({"error": "'scenarios' must be a non-empty list of scenario texts"}), 400
+    if len(scenarios) > COMPARE_MAX_SCENARIOS:
+        return jsonify({"error": f"At most {COMPARE_MAX_SCENARIOS} scenarios can be compared at once"}), 400
+    if rank_by not in COMPARE_METRICS:
+        return jsonify({"error": f"'rankBy' must be one of {list(COMPARE_METRICS)}"}), 400
+    scenarios = [str(text) for text in scenarios]
+    
+    environment = [
+        float(data.get('rainfall', 50)),
+        float(data.get('waterLevel', 2)),
+        float(data.get('humidity', 60)),
+        float(data.get('temperature', 20))
+    ]
+    
+    # All texts go through the encoder and regressor as one batch
+    model = scenario_model.get()
+    scenario_factors = None
+    if model is not None:
+        try:
+            with metrics.stage("scenario_predict"):
+                scenario_factors = model.predict_batch(scenarios)
+        except Exception as e:
+            print(f"Error in scenario prediction: {e}")
+    if scenario_factors is None:
+        scenario_factors = [dict.fromkeys(FACTOR_NAMES, 5.0) for _ in scenarios]
+    
+    # One state row per scenario: every trajectory is stepped and scored together
+    with metrics.stage("initial_state"):
+        rows = [environment + [float(factors[f]) for f in FACTOR_NAMES] for factors in scenario_factors]
+        x0 = build_initial_states(rows)
+        feature_scaler, risk_model, network = scaler.get(), flood_risk_model.get(), nn_model.get()
+    with metrics.stage("year_loop"):
+        states = flood_simulation.simulate_states(x0, years)
+    with metrics.stage("risk_model"):
+        risk_matrix = flood_simulation.score_states(states, years, feature_scaler, risk_model, network, history=x0)
+    
+    summaries = {
+        "mean": risk_matrix.mean(axis=0),
+        "final": risk_matrix[-1],
+        "peak": risk_matrix.max(axis=0)
+    }
+    # Lowest risk first; ties keep the order the scenarios were given in and share
+    # a rank (1, 2, 2, 4), judged on the rounded values the response reports
+    scores = np.round(summaries[rank_by], 2)
+    ranking = np.argsort(scores, kind="stable")
+    ranks = np.searchsorted(np.sort(scores), scores, side="left") + 1
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    tied = counts[inverse] > 1
+    
+    results = [{
+        "scenario": text,
+        "scenario_factors": {f: round(float(factors[f]), 2) for f in FACTOR_NAMES},
+        "risks": [round(float(r), 2) for r in risk_matrix[:, i]],
+        "mean_risk": round(float(summaries["mean"][i]), 2),
+        "final_risk": round(float(summaries["final"][i]), 2),
+        "peak_risk": round(float(summaries["peak"][i]), 2),
+        "rank": int(ranks[i]),
+        "tied": bool(tied[i])
+    } for i, (text, factors) in enumerate(zip(scenarios, scenario_factors))]
+    
+    with metrics.stage("serialize"):
+        return jsonify({
+            "years": list(range(years)),
+            "features": dict(zip(ENV_NAMES, environment)),
+            "rankBy": rank_by,
+            "scenarios": results,
+            "ranking": [scenarios[i] for i in ranking],
+            "factorsAffectRisk": factors_affect_risk(risk_model),
+            "note": None if factors_affect_risk(risk_model) else FACTORS_IGNORED_NOTE
+        })
+
+
+HINDCAST_MAX_STEPS = int(os.environ.get("FLOODSENSE_HINDCAST_MAX_STEPS", 1000))
+
+
+@app.route('/api/hindcast', methods=['POST'])
+def hindcast():
+    """Score an observed gauge series step by step, then optionally simulate on from its last reading"""
+    data = request.json
+    observations = data.get('history') or []
+    years = max(0, int(data.get('years', 0)))
+    error = horizon_error(years, minimum=0)
+    if error:
+        return error
+    if not isinstance(observations, list) or not observations:
+        return jsonify({"error": "'history' must be a non-empty list of observations, oldest first"}), 400
+    if len(observations) > HINDCAST_MAX_STEPS:
+        return jsonify({"error": f"At most {HINDCAST_MAX_STEPS} observations can be hindcast at once"}), 400
+    try:
+        environment = [[float(obs['rainfall']), float(obs['waterLevel']),
+                        float(obs['humidity']), float(obs['temperature'])] for obs in observations]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Every observation needs numeric rainfall, waterLevel, humidity and temperature"}), 400
+    
+    climate = dict.fromkeys(FACTOR_NAMES, 5.0)
+    scenario_text = data.get('scenario')
+    batcher = scenario_batcher.get() if scenario_text else None
+    if batcher is not None:
+        try:
+            with metrics.stage("scenario_predict"):
+                climate.update(batcher.submit(scenario_text))
+        except QueueFullError as e:
+            return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+        except Exception as e:
+            print(f"Error in scenario prediction: {e}")
+    climate.update({f: float(v) for f, v in (data.get('factors') or {}).items() if f in climate})
+    
+    # The observed series becomes a (steps x 1 x 9) state history
+    with metrics.stage("initial_state"):
+        observed = build_initial_states([row + [climate[f] for f in FACTOR_NAMES] for row in environment])
+        feature_scaler, risk_model, network = scaler.get(), flood_risk_model.get(), nn_model.get()
+    with metrics.stage("risk_model"):
+        observed_risks, forecast_risks, states = flood_simulation.hindcast(
+            observed[:, np.newaxis, :], years, feature_scaler, risk_model, network)
+    
+    with metrics.stage("serialize"):
+        return jsonify({
+            "steps": len(observations),
+            "sequenceLength": flood_simulation.SEQUENCE_LENGTH,
+            "factors": {f: round(float(climate[f]), 2) for f in FACTOR_NAMES},
+            "hindcast": [round(float(r), 2) for r in observed_risks[:, 0]],
+            "forecast": [round(float(r), 2) for r in forecast_risks[:, 0]],
+            "feature_trajectories": {
+                f: [round(float(v), 2) for v in states[:, 0, N_ENV + i] * 10] for i, f in enumerate(FACTOR_NAMES)
+            }
+        })
+
+
+# Optionally start loading every model in the background right away. Ensemble
+# pool workers re-import this module when it is run as a script; they skip it
+if os.environ.get("FLOODSENSE_WARMUP", "0") == "1" and multiprocessing.parent_process() is None:
+    warm_up_models()
+
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000) 
\ No newline at end of file
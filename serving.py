@@ -0,0 +1,76 @@
+"""Process setup for production serving with several worker processes
+
+Every worker runs its own torch, TensorFlow, BLAS and OpenMP thread pools, so
+each is limited to its share of the cores; otherwise N workers each start one
+thread per core and throughput flattens out as they fight over the CPUs.
+"""
+import os
+
+# Thread-pool sizes are read by the native libraries when they are first
+# imported, so these are set before server.py (and numpy) are loaded
+THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "TF_NUM_INTRAOP_THREADS"
+]
+
+
+def worker_count():
+    return int(os.environ.get("FLOODSENSE_WORKERS", os.cpu_count() or 1))
+
+
+def threads_per_worker():
+    """Native threads each worker may use, by default an even share of the cores"""
+    default = max(1, (os.cpu_count() or 1) // worker_count())
+    return int(os.environ.get("FLOODSENSE_THREADS_PER_WORKER", default))
+
+
+def configure_threads(threads=None):
+    """Limit the native thread pools of this process; call before importing server"""
+    threads = threads or threads_per_worker()
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    # Ensembles run in the request's own worker; a pool per worker would oversubscribe the cores
+    os.environ.setdefault("FLOODSENSE_ENSEMBLE_JOBS", "1")
+    return threads
+
+
+def apply_thread_limits(threads=None):
+    """Re-apply the limits inside a forked worker, for libraries the master already loaded"""
+    threads = threads or threads_per_worker()
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(threads)
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+
+
+def preload_models():
+    """Load every model in this process so forked workers share the weights copy-on-write
+
+    Models are loaded synchronously: no loader or batcher thread may be running
+    when the master forks, since threads do not survive into the workers.
+    """
+    import server
+    for lazy_model in server.lazy_models:
+        lazy_model.get()
+        print(f"Preloaded {lazy_model.name}: {lazy_model.state}")
+
+
+def after_fork():
+    """Per-worker setup once the master has forked"""
+    import numpy as np
+    apply_thread_limits()
+    # Workers inherit the master's global RNG state; without a reseed every
+    # worker would add the same "random" noise sequence to its predictions
+    np.random.seed()
+    # An ensemble pool cannot be shared across the fork, so each worker starts its own now
+    import server
+    server.warm_up_ensemble_pool()
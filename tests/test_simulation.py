@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.preprocessing import StandardScaler
+
+from flood_simulation import BASE_DRIFT, DEGRADING, N_ENV, score_states, simulate_states
+
+LOW, HIGH = np.array([0, 0, 20, -5]), np.array([200, 10, 100, 40])
+
+
+@pytest.fixture(scope="module")
+def scaler():
+    X = np.random.default_rng(0).uniform(LOW, HIGH, size=(500, N_ENV))
+    return StandardScaler().fit(X)
+
+
+@pytest.fixture(scope="module")
+def risk_model():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(LOW, HIGH, size=(2000, N_ENV))
+    y = X[:, 0] / 40 + X[:, 1] / 4 + X[:, 2] / 50 - X[:, 3] / 40 + rng.normal(0, 0.3, len(X))
+    return GradientBoostingRegressor(n_estimators=30, max_depth=3, random_state=42).fit(X, y)
+
+
+def initial_states(scaler, n, seed):
+    rng = np.random.default_rng(seed)
+    env = scaler.transform(rng.uniform(LOW, HIGH, size=(n, N_ENV)))
+    return np.hstack([env, rng.uniform(0, 1, size=(n, len(BASE_DRIFT)))])
+
+
+def reference_loop(x0, years, scaler, risk_model, noise):
+    """One scenario and one year at a time, as the simulation ran before it was vectorized"""
+    states = np.empty((years,) + x0.shape)
+    risks = np.empty((years, len(x0)))
+    for s, xt in enumerate(x0.copy()):
+        for t in range(years):
+            for i, drift in enumerate(BASE_DRIFT):
+                idx = N_ENV + i
+                modifier = 1.0
+                if i == 0 and t > 10:
+                    modifier = 1.2
+                if i == 1 and xt[idx] > 0.7:
+                    modifier = 0.7
+                if DEGRADING[i]:
+                    xt[idx] = max(0, xt[idx] - drift * modifier * 0.5)
+                else:
+                    xt[idx] = min(1.0, xt[idx] + drift * modifier)
+            if xt[6] > 0.6:
+                xt[4] = min(1.0, xt[4] + 0.01)
+            states[t, s] = xt
+
+            if risk_model is not None:
+                risk = float(risk_model.predict(scaler.inverse_transform(xt[:N_ENV].reshape(1, -1)))[0])
+                risks[t, s] = min(max(risk, 0), 10)
+                continue
+            urban_impact = max(0, xt[5] - 0.2) if xt[7] > 0.7 else xt[5] * 1.2
+            water_impact = xt[1] * 0.3 * (1.0 - (xt[8] * 0.5))
+            env_risk = xt[0] * 0.4 + water_impact + xt[2] * xt[3] * 0.3
+            climate_impact = xt[4] * 0.5 + urban_impact * 0.3 + xt[6] * 0.2
+            env_weight = 0.8 - (t / years * 0.3)
+            risk = (env_risk * env_weight + climate_impact * (1.0 - env_weight)) * 10
+            risks[t, s] = min(max(risk + noise[t, s], 0), 10)
+    return risks, states
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("years", [1, 11, 12, 40])
+@pytest.mark.parametrize("use_model", [True, False], ids=["risk_model", "heuristic"])
+def test_vectorized_matches_reference_loop(scaler, risk_model, seed, years, use_model):
+    x0 = initial_states(scaler, 25, seed)
+    model = risk_model if use_model else None
+    noise = np.random.default_rng(seed + 100).normal(0, 0.1, size=(years, len(x0)))
+
+    expected_risks, expected_states = reference_loop(x0, years, scaler, model, noise)
+    states = simulate_states(x0, years)
+    risks = score_states(states, years, scaler, model, noise=noise)
+
+    np.testing.assert_allclose(states, expected_states, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(risks, expected_risks, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,76 @@
+import json
+
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor
+
+import tree_inference
+from tree_inference import CompiledTreeEnsemble, export_model, predict_exported
+
+LOW, HIGH = np.array([0, 0, 20, -5]), np.array([200, 10, 100, 40])
+
+
+def fitted_model(max_depth, n_estimators=30, n_samples=2000):
+    rng = np.random.default_rng(0)
+    X = rng.uniform(LOW, HIGH, size=(n_samples, 4))
+    y = np.sin(X[:, 0] / 30) * X[:, 1] + X[:, 2] / 25 - X[:, 3] / 20 + rng.normal(0, 0.3, n_samples)
+    return GradientBoostingRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=42).fit(X, y)
+
+
+def inputs(n=5000, seed=1):
+    return np.random.default_rng(seed).uniform(LOW, HIGH, size=(n, 4))
+
+
+@pytest.fixture(scope="module")
+def shallow_model():
+    return fitted_model(max_depth=4)
+
+
+@pytest.mark.parametrize("n", [1, 7, 300, 5000])
+def test_lookup_tables_match_sklearn(shallow_model, n):
+    compiled = CompiledTreeEnsemble.from_sklearn(shallow_model)
+    X = inputs(n)
+    assert np.array_equal(compiled.predict(X), shallow_model.predict(X))
+    assert compiled._use_tables
+
+
+def test_walk_matches_sklearn(shallow_model, monkeypatch):
+    monkeypatch.setattr(tree_inference, "MAX_TABLE_CELLS", 0)
+    compiled = CompiledTreeEnsemble.from_sklearn(shallow_model)
+    X = inputs()
+    assert np.array_equal(compiled.predict(X), shallow_model.predict(X))
+    assert not compiled._use_tables
+
+
+def test_deep_trees_use_the_walk():
+    model = fitted_model(max_depth=8, n_estimators=10)
+    compiled = CompiledTreeEnsemble.from_sklearn(model)
+    assert compiled.table_cells() > tree_inference.MAX_TABLE_CELLS
+    X = inputs()
+    assert np.array_equal(compiled.predict(X), model.predict(X))
+    assert not compiled._use_tables
+
+
+def test_thresholds_take_the_same_branch(shallow_model):
+    compiled = CompiledTreeEnsemble.from_sklearn(shallow_model)
+    is_split = compiled.left != np.arange(len(compiled.left))
+    X = np.tile(inputs(1), (int(is_split.sum()), 1))
+    X[np.arange(len(X)), compiled.feature[is_split]] = compiled.threshold[is_split]
+    assert np.array_equal(compiled.predict(X), shallow_model.predict(X))
+
+
+@pytest.mark.parametrize("bad", [np.nan, np.inf, 1e300])
+def test_non_finite_input_is_rejected(shallow_model, bad):
+    X = inputs(3)
+    X[1, 2] = bad
+    with pytest.raises(ValueError):
+        shallow_model.predict(X)
+    with pytest.raises(ValueError):
+        CompiledTreeEnsemble.from_sklearn(shallow_model).predict(X)
+
+
+def test_exported_model_matches_sklearn(shallow_model):
+    compiled = CompiledTreeEnsemble.from_sklearn(shallow_model)
+    doc = json.loads(json.dumps(export_model(compiled, ["a", "b", "c", "d"])))
+    X = inputs(500)
+    assert np.array_equal(predict_exported(doc, X), shallow_model.predict(X))
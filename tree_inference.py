@@ -0,0 +1,314 @@
+"""Array-backed inference for fitted gradient-boosted tree ensembles
+
+``CompiledTreeEnsemble`` flattens the trees of a fitted scikit-learn
+GradientBoostingRegressor into a handful of NumPy arrays once, then walks all
+trees level by level with vectorized gathers. Shallow ensembles are further
+turned into per-tree lookup tables when those stay small. It skips sklearn's
+per-call dispatch and returns bit-identical predictions:
+
+    python tree_inference.py                    # microbenchmark against sklearn
+    python tree_inference.py --export model.json  # standalone model for the browser
+"""
+import json
+import time
+
+import numpy as np
+
+# Samples are scored in chunks so the (samples x trees) index matrix stays small
+CHUNK_CELLS = 1 << 18
+
+# Below this many samples the per-tree accumulation loop costs more than it saves
+SMALL_BATCH = 256
+
+# Lookup tables grow with the product of each tree's threshold counts, i.e.
+# exponentially with depth; past this many cells the level-by-level walk is used
+MAX_TABLE_CELLS = 1 << 20
+
+# Bumped whenever the exported JSON layout changes, so old clients can refuse newer files
+EXPORT_FORMAT = "floodsense-tree-ensemble"
+EXPORT_FORMAT_VERSION = 1
+
+
+class CompiledTreeEnsemble:
+    """Flat-array copy of a single-output GradientBoostingRegressor
+
+    All trees share one node table: ``feature``, ``threshold``, ``left``,
+    ``right`` and ``value`` are indexed by global node id and ``roots`` holds
+    each tree's first node. Leaves point to themselves, so every tree can be
+    walked for ``max_depth`` steps regardless of where its leaves sit.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 init, learning_rate, feature_importances=None):
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.max_depth = int(max_depth)
+        self.init = float(init)
+        self.learning_rate = float(learning_rate)
+        self.n_features_in_ = int(self.feature.max()) + 1 if len(self.feature) else 0
+        # sklearn recomputes this from every tree on each access
+        self.feature_importances_ = (np.asarray(feature_importances, dtype=np.float64)
+                                     if feature_importances is not None else None)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Export a fitted GradientBoostingRegressor with the default init estimator"""
+        init = getattr(model.init_, "constant_", None)
+        if init is None or np.size(init) != 1:
+            raise ValueError("Only single-output models with a constant init estimator can be compiled")
+
+        feature, threshold, left, right, value, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in model.estimators_[:, 0]:
+            tree = estimator.tree_
+            is_leaf = tree.children_left == -1
+            ids = offset + np.arange(tree.node_count)
+            # Leaves compare feature 0 against +inf and loop back onto themselves
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+            left.append(np.where(is_leaf, ids, offset + tree.children_left))
+            right.append(np.where(is_leaf, ids, offset + tree.children_right))
+            value.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left),
+                   np.concatenate(right), np.concatenate(value), roots, max_depth,
+                   np.ravel(init)[0], model.learning_rate, model.feature_importances_)
+
+    def to_arrays(self):
+        """The flat arrays and scalars, e.g. for saving or exporting the model"""
+        return {
+            "feature": self.feature, "threshold": self.threshold, "left": self.left,
+            "right": self.right, "value": self.value, "roots": self.roots,
+            "max_depth": self.max_depth, "init": self.init, "learning_rate": self.learning_rate,
+            "feature_importances": self.feature_importances_
+        }
+
+    def table_cells(self):
+        """Cells the per-tree lookup tables would need, computed without building them"""
+        is_split = self.left != np.arange(len(self.left))
+        bounds = np.append(self.roots, len(self.left))
+        cells = 0
+        for t in range(len(self.roots)):
+            nodes = slice(bounds[t], bounds[t + 1])
+            cells += int(np.prod([len(np.unique(self.threshold[nodes][is_split[nodes] & (self.feature[nodes] == f)])) + 1
+                                  for f in range(self.n_features_in_)], dtype=np.float64))
+        return cells
+
+    def _build_tables(self):
+        # Each tree is piecewise constant over the grid formed by its own
+        # thresholds, so it becomes a lookup table indexed by which side of every
+        # threshold the inputs fall. Inputs are binned once against the union of
+        # all thresholds; per-tree maps turn those global bins into table offsets.
+        n_trees = len(self.roots)
+        is_split = self.left != np.arange(len(self.left))
+        bounds = np.append(self.roots, len(self.left))
+        self.bin_edges = [np.unique(self.threshold[is_split & (self.feature == f)])
+                          for f in range(self.n_features_in_)]
+        # Indexed [global bin, tree] so binning a sample gathers one contiguous row
+        self._bin_offsets = [np.empty((len(edges) + 1, n_trees), dtype=np.intp) for edges in self.bin_edges]
+
+        tables = []
+        table_offset = 0
+        for t in range(n_trees):
+            nodes = slice(bounds[t], bounds[t + 1])
+            local_edges = [np.unique(self.threshold[nodes][is_split[nodes] & (self.feature[nodes] == f)])
+                           for f in range(self.n_features_in_)]
+            shape = [len(edges) + 1 for edges in local_edges]
+            strides = np.cumprod([1] + shape[:0:-1])[::-1]
+
+            for f, edges in enumerate(self.bin_edges):
+                # The upper edge of each global bin stands in for every input in it
+                representative = np.append(edges, np.inf)
+                local_bin = np.searchsorted(local_edges[f], representative)
+                self._bin_offsets[f][:, t] = local_bin * strides[f] + (table_offset if f == 0 else 0)
+
+            # Walk the tree once for a representative point of every table cell
+            cells = np.indices(shape).reshape(len(shape), -1)
+            points = np.stack([np.append(edges, np.inf)[cells[f]] for f, edges in enumerate(local_edges)], axis=1)
+            node = np.full(len(points), self.roots[t])
+            for _ in range(self.max_depth):
+                go_left = points[np.arange(len(points)), self.feature[node]] <= self.threshold[node]
+                node = np.where(go_left, self.left[node], self.right[node])
+            tables.append(self.value[node])
+            table_offset += len(points)
+
+        # sklearn adds learning_rate * value per stage; the product is exact to precompute
+        self._scaled_tables = self.learning_rate * np.concatenate(tables)
+
+    def predict(self, X):
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] < self.n_features_in_:
+            raise ValueError(f"Expected a 2-D array with {self.n_features_in_} features, got shape {X.shape}")
+        # Like sklearn, refuse NaN and values too large for float32 rather than route them down a branch
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN, infinity or a value too large for dtype('float32')")
+        if not hasattr(self, "_use_tables"):
+            self._use_tables = self.table_cells() <= MAX_TABLE_CELLS
+            if self._use_tables:
+                self._build_tables()
+            else:
+                # sklearn adds learning_rate * value per stage; the product is exact to precompute
+                self._scaled_values = self.learning_rate * self.value
+                # Node n's children sit at 2n (left) and 2n + 1 (right), so a branch is one gather
+                self._children = np.stack([self.left, self.right], axis=1).ravel()
+        out = np.empty(len(X))
+        chunk = max(1, CHUNK_CELLS // len(self.roots))
+        for start in range(0, len(X), chunk):
+            out[start:start + chunk] = self._predict_chunk(X[start:start + chunk])
+        return out
+
+    def _leaf_stages(self, X, stages):
+        """Fill ``stages`` with each tree's scaled leaf value by walking all trees one level at a time"""
+        flat = X.astype(np.float64).ravel()
+        row_starts = (np.arange(len(X)) * X.shape[1])[:, np.newaxis]
+        node = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        for _ in range(self.max_depth):
+            go_right = np.take(flat, row_starts + np.take(self.feature, node)) > np.take(self.threshold, node)
+            node = np.take(self._children, 2 * node + go_right)
+        np.take(self._scaled_values, node, out=stages)
+
+    def _table_stages(self, X, stages):
+        """Fill ``stages`` with each tree's scaled leaf value from the lookup tables"""
+        # (samples x trees) offsets into the concatenated lookup tables
+        index = None
+        for f, edges in enumerate(self.bin_edges):
+            offsets = self._bin_offsets[f][np.searchsorted(edges, X[:, f].astype(np.float64))]
+            if index is None:
+                index = offsets
+            else:
+                index += offsets
+        np.take(self._scaled_tables, index, out=stages)
+
+    def _predict_chunk(self, X):
+        stages = np.empty((len(X), len(self.roots) + 1))
+        stages[:, 0] = self.init
+        if self._use_tables:
+            self._table_stages(X, stages[:, 1:])
+        else:
+            self._leaf_stages(X, stages[:, 1:])
+
+        # Accumulate stage by stage in the same order as sklearn's predict_stages
+        # so the float64 sums are bit-identical. cumsum adds strictly in order
+        # and is cheapest for a few samples; column adds win on large chunks.
+        if len(X) < SMALL_BATCH:
+            return np.cumsum(stages, axis=1)[:, -1]
+        out = stages[:, 0].copy()
+        for t in range(1, stages.shape[1]):
+            out += stages[:, t]
+        return out
+
+
+def export_model(compiled, feature_names, scaler=None, version=None):
+    """JSON-ready copy of a compiled ensemble and its StandardScaler for client-side scoring
+
+    Nodes are flat lists shared by all trees; a leaf's children point back at
+    itself. Floats are written with full precision, so an evaluator that
+    rounds inputs to float32 before comparing against thresholds (as sklearn
+    does) and adds the stages in order reproduces ``predict`` exactly.
+    """
+    is_leaf = compiled.left == np.arange(len(compiled.left))
+    doc = {
+        "format": EXPORT_FORMAT,
+        "formatVersion": EXPORT_FORMAT_VERSION,
+        "modelVersion": version,
+        "features": list(feature_names),
+        "init": compiled.init,
+        "learningRate": compiled.learning_rate,
+        "roots": compiled.roots.tolist(),
+        "feature": np.where(is_leaf, 0, compiled.feature).tolist(),
+        # JSON has no infinity; leaves are recognised by their self-loop instead
+        "threshold": np.where(is_leaf, 0.0, compiled.threshold).tolist(),
+        "left": compiled.left.tolist(),
+        "right": compiled.right.tolist(),
+        "value": compiled.value.tolist(),
+        "scaler": None
+    }
+    if scaler is not None and hasattr(scaler, "mean_"):
+        doc["scaler"] = {"mean": scaler.mean_.tolist(), "scale": scaler.scale_.tolist()}
+    return doc
+
+
+def predict_exported(doc, X):
+    """Reference evaluator for an exported model, the same algorithm as script.js"""
+    feature, threshold = doc["feature"], doc["threshold"]
+    left, right, value = doc["left"], doc["right"], doc["value"]
+    out = []
+    for row in np.asarray(X, dtype=np.float32).astype(np.float64).tolist():
+        total = doc["init"]
+        for node in doc["roots"]:
+            while left[node] != node:
+                node = left[node] if row[feature[node]] <= threshold[node] else right[node]
+            total += doc["learningRate"] * value[node]
+        out.append(total)
+    return np.array(out)
+
+
+def verify_against_sklearn(model, X):
+    """Raise AssertionError unless the compiled model reproduces ``model.predict(X)`` exactly"""
+    compiled = CompiledTreeEnsemble.from_sklearn(model)
+    expected = model.predict(X)
+    actual = compiled.predict(X)
+    mismatched = int(np.count_nonzero(expected != actual))
+    assert mismatched == 0, f"{mismatched} of {len(X)} predictions differ, max error {np.abs(expected - actual).max()}"
+    return compiled
+
+
+def benchmark_predict(model, compiled, batch_sizes=(1, 1000, 1000000), repeats=20, seed=0):
+    """Mean seconds per predict call for sklearn and the compiled model at each batch size"""
+    rng = np.random.default_rng(seed)
+    # Inputs spread over the training range of the risk model features
+    low, high = np.array([0, 0, 20, -5]), np.array([200, 10, 100, 40])
+    results = {}
+    for n in batch_sizes:
+        X = rng.uniform(low, high, size=(n, len(low)))
+        timings = {}
+        for name, predict in (("sklearn", model.predict), ("compiled", compiled.predict)):
+            calls = max(1, repeats if n < 100000 else repeats // 10)
+            predict(X)
+            start = time.perf_counter()
+            for _ in range(calls):
+                predict(X)
+            timings[name] = (time.perf_counter() - start) / calls
+        assert np.array_equal(model.predict(X), compiled.predict(X))
+        timings["speedup"] = timings["sklearn"] / timings["compiled"]
+        results[n] = timings
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--export", metavar="PATH", help="write the model as JSON for client-side scoring and exit")
+    args = parser.parse_args()
+
+    import server
+    artifacts = server.risk_artifacts.get() or {}
+    risk_model = artifacts.get("flood_risk_model")
+    if risk_model is None:
+        raise SystemExit("No trained risk model available")
+
+    X = np.random.default_rng(1).uniform([0, 0, 20, -5], [200, 10, 100, 40], size=(2000, 4))
+    compiled = CompiledTreeEnsemble.from_sklearn(risk_model)
+    print(f"Compiled {len(compiled.roots)} trees ({len(compiled.value)} nodes)")
+
+    if args.export:
+        doc = json.loads(json.dumps(server.exported_risk_model()))
+        # Round-trip through JSON and check the browser algorithm still matches sklearn
+        assert np.array_equal(predict_exported(doc, X), risk_model.predict(X))
+        with open(args.export, "w") as f:
+            json.dump(doc, f, separators=(",", ":"))
+        print(f"Exported model version {doc['modelVersion']} to {args.export}")
+        raise SystemExit(0)
+
+    print(f"{'batch':>10} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>8}")
+    for n, timings in benchmark_predict(risk_model, compiled).items():
+        print(f"{n:>10} {timings['sklearn'] * 1000:>12.3f} {timings['compiled'] * 1000:>12.3f} {timings['speedup']:>7.1f}x")
@@ -0,0 +1,13 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+import serving
+
+serving.configure_threads()
+
+import server  # noqa: E402  (thread limits must be set before numpy, torch and TensorFlow load)
+
+if os.environ.get("FLOODSENSE_PRELOAD", "1") == "1":
+    serving.preload_models()
+
+app = server.app